@@ -20,6 +20,7 @@ class ConfigManager:
             except Exception:
                 print("Error getting secrets creds from config-file")
                 raise
+            self.load_settings()
 
     async def reload_creds(self) -> None:
         async with async_open(self._config_file, "r") as f:
@@ -31,6 +32,125 @@ class ConfigManager:
             except Exception:
                 print("Error getting secrets creds from config-file")
                 raise
+            self.load_settings()
+
+    def load_settings(self) -> None:
+        bot_api_data = self.data.get("bot_api") or {}
+        self.BOT_API_SERVER = bot_api_data.get("server")
+
+        db_data = self.data.get("db") or {}
+        self.DB_POOL_SIZE = int(db_data.get("pool_size", 5))
+        self.DB_MAX_OVERFLOW = int(db_data.get("max_overflow", 10))
+        self.DB_POOL_TIMEOUT = float(db_data.get("pool_timeout", 30))
+        self.DB_POOL_RECYCLE = int(db_data.get("pool_recycle", 1800))
+        self.DB_POOL_PRE_PING = bool(db_data.get("pool_pre_ping", True))
+        self.DB_STATEMENT_CACHE_SIZE = int(db_data.get("statement_cache_size", 100))
+        sqlite_data = db_data.get("sqlite") or {}
+        self.DB_READ_POOL_SIZE = int(sqlite_data.get("read_pool_size", 5))
+        self.DB_SQLITE_JOURNAL_MODE = sqlite_data.get("journal_mode", "WAL")
+        self.DB_SQLITE_SYNCHRONOUS = sqlite_data.get("synchronous", "NORMAL")
+        self.DB_SQLITE_MMAP_SIZE = int(sqlite_data.get("mmap_size", 256 * 1024 * 1024))
+        self.DB_SQLITE_BUSY_TIMEOUT = int(sqlite_data.get("busy_timeout", 5000))
+
+        forward_data = self.data.get("forward") or {}
+        self.FORWARD_MAX_CONCURRENCY = int(forward_data.get("max_concurrency", 20))
+        self.FORWARD_MAX_PER_HOST = int(forward_data.get("max_per_host", 4))
+
+        outbox_data = self.data.get("outbox") or {}
+        self.OUTBOX_WORKERS = int(outbox_data.get("workers", 4))
+        self.OUTBOX_BATCH_SIZE = int(outbox_data.get("batch_size", 20))
+        self.OUTBOX_POLL_INTERVAL = float(outbox_data.get("poll_interval", 1))
+        self.OUTBOX_LEASE = float(outbox_data.get("lease", 60))
+        self.OUTBOX_MAX_ATTEMPTS = int(outbox_data.get("max_attempts", 8))
+        self.OUTBOX_BACKOFF_BASE = float(outbox_data.get("backoff_base", 2))
+        self.OUTBOX_BACKOFF_MAX = float(outbox_data.get("backoff_max", 600))
+
+        media_data = self.data.get("media") or {}
+        self.MEDIA_MEMORY_LIMIT = int(media_data.get("memory_limit", 1024 * 1024))
+        self.MEDIA_MAX_FILE_SIZE = int(
+            media_data.get("max_file_size", 20 * 1024 * 1024)
+        )
+        self.MEDIA_SPOOL_DIR = media_data.get("spool_dir")
+        self.MEDIA_DOWNLOAD_CONCURRENCY = int(media_data.get("download_concurrency", 4))
+
+        media_group_data = self.data.get("media_group") or {}
+        self.MEDIA_GROUP_STORE = media_group_data.get("store", "memory")
+        self.MEDIA_GROUP_QUIET_WINDOW = float(media_group_data.get("quiet_window", 2))
+        self.MEDIA_GROUP_MAX_WAIT = float(media_group_data.get("max_wait", 10))
+
+        probe_data = self.data.get("probe") or {}
+        self.PROBE_CACHE_TTL = float(probe_data.get("ttl", 3600))
+        self.PROBE_NEGATIVE_TTL = float(probe_data.get("negative_ttl", 300))
+        self.PROBE_TIMEOUT = float(probe_data.get("timeout", 5))
+
+        http_data = self.data.get("http") or {}
+        self.HTTP_MAX_CONNECTIONS = int(http_data.get("max_connections", 100))
+        self.HTTP_MAX_KEEPALIVE_CONNECTIONS = int(
+            http_data.get("max_keepalive_connections", 20)
+        )
+        self.HTTP_KEEPALIVE_EXPIRY = float(http_data.get("keepalive_expiry", 60))
+        self.HTTP_TIMEOUT = float(http_data.get("timeout", 5))
+        self.HTTP_HTTP2 = bool(http_data.get("http2", False))
+        self.HTTP_RETRIES = int(http_data.get("retries", 0))
+
+        dns_data = self.data.get("dns") or {}
+        self.DNS_CACHE = bool(dns_data.get("cache", True))
+        self.DNS_PREFETCH = bool(dns_data.get("prefetch", True))
+        self.DNS_TTL = float(dns_data.get("ttl", 300))
+        self.DNS_MIN_TTL = float(dns_data.get("min_ttl", 30))
+        self.DNS_MAX_TTL = float(dns_data.get("max_ttl", 3600))
+        self.DNS_NEGATIVE_TTL = float(dns_data.get("negative_ttl", 30))
+
+        routing_data = self.data.get("routing") or {}
+        self.ROUTING_SNAPSHOT = bool(routing_data.get("snapshot", True))
+        self.ROUTING_POLL_INTERVAL = float(routing_data.get("poll_interval", 2))
+        self.ROUTING_LISTEN = bool(routing_data.get("listen", True))
+
+        prefilter_data = self.data.get("prefilter") or {}
+        self.PREFILTER_ENABLED = bool(prefilter_data.get("enabled", True))
+        self.PREFILTER_REFRESH_INTERVAL = float(
+            prefilter_data.get("refresh_interval", 10)
+        )
+
+        logging_data = self.data.get("logging") or {}
+        self.LOG_LEVEL = str(logging_data.get("level", "INFO")).upper()
+        self.LOG_FORMAT = logging_data.get("format", "json")
+        self.LOG_LEVELS = {
+            name: str(level).upper()
+            for name, level in (logging_data.get("levels") or {}).items()
+        }
+        self.LOG_SAMPLING = {"update": 0.01, "delivered": 0.1}
+        self.LOG_SAMPLING.update(
+            {
+                event: float(rate)
+                for event, rate in (logging_data.get("sampling") or {}).items()
+            }
+        )
+
+        tracing_data = self.data.get("tracing") or {}
+        self.TRACING_ENABLED = bool(tracing_data.get("enabled", False))
+        self.TRACING_EXPORTER = tracing_data.get("exporter", "file")
+        self.TRACING_PATH = tracing_data.get("path", "traces.jsonl")
+        self.TRACING_SAMPLE_RATE = float(tracing_data.get("sample_rate", 0.1))
+
+        metrics_data = self.data.get("metrics") or {}
+        self.METRICS_ENABLED = bool(metrics_data.get("enabled", False))
+        self.METRICS_TOKEN = metrics_data.get("token") or None
+
+        recorder_data = self.data.get("recorder") or {}
+        self.RECORDER_ENABLED = bool(recorder_data.get("enabled", False))
+        self.RECORDER_DIR = recorder_data.get("dir", "recordings")
+        self.RECORDER_SEGMENT_SIZE = int(
+            recorder_data.get("segment_size", 64 * 1024 * 1024)
+        )
+        self.RECORDER_SEGMENT_SECONDS = float(
+            recorder_data.get("segment_seconds", 3600)
+        )
+        self.RECORDER_REDACT = bool(recorder_data.get("redact", True))
+        self.RECORDER_QUEUE_SIZE = int(recorder_data.get("queue_size", 10000))
+
+        debug_data = self.data.get("debug") or {}
+        self.DEBUG_DUMP_UPDATES = bool(debug_data.get("dump_updates", False))
 
     def load_secrets(self) -> None:
         try:
@@ -0,0 +1,178 @@
+import ssl
+from contextlib import contextmanager
+from importlib.util import find_spec
+from typing import AsyncIterable, AsyncIterator, Iterator
+
+import httpcore
+import httpx
+
+from .config import cfg
+from .logs import get_logger
+from .resolver import ResolvingNetworkBackend, dns_resolver
+from .tracing import tracer
+
+logger = get_logger(__name__)
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """Span per outbound request, only host is recorded, webhook paths carry
+    tokens."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport) -> None:
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with tracer.span(f"http {request.method}", host=request.url.host) as span:
+            response = await self._transport.handle_async_request(request)
+            if span is not None:
+                span["attributes"]["status_code"] = response.status_code
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+# same mapping as httpx's own transport does
+HTTPCORE_EXCEPTIONS = {
+    httpcore.TimeoutException: httpx.TimeoutException,
+    httpcore.ConnectTimeout: httpx.ConnectTimeout,
+    httpcore.ReadTimeout: httpx.ReadTimeout,
+    httpcore.WriteTimeout: httpx.WriteTimeout,
+    httpcore.PoolTimeout: httpx.PoolTimeout,
+    httpcore.NetworkError: httpx.NetworkError,
+    httpcore.ConnectError: httpx.ConnectError,
+    httpcore.ReadError: httpx.ReadError,
+    httpcore.WriteError: httpx.WriteError,
+    httpcore.ProxyError: httpx.ProxyError,
+    httpcore.UnsupportedProtocol: httpx.UnsupportedProtocol,
+    httpcore.ProtocolError: httpx.ProtocolError,
+    httpcore.LocalProtocolError: httpx.LocalProtocolError,
+    httpcore.RemoteProtocolError: httpx.RemoteProtocolError,
+}
+
+
+@contextmanager
+def map_httpcore_exceptions() -> Iterator[None]:
+    try:
+        yield
+    except Exception as e:
+        mapped = None
+        for from_exception, to_exception in HTTPCORE_EXCEPTIONS.items():
+            # the most specific one, ReadTimeout rather than TimeoutException
+            if isinstance(e, from_exception) and (
+                mapped is None or issubclass(to_exception, mapped)
+            ):
+                mapped = to_exception
+        if mapped is None:
+            raise
+        raise mapped(str(e)) from e
+
+
+class PoolResponseStream(httpx.AsyncByteStream):
+    def __init__(self, stream: AsyncIterable[bytes]) -> None:
+        self._stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        with map_httpcore_exceptions():
+            async for part in self._stream:
+                yield part
+
+    async def aclose(self) -> None:
+        if hasattr(self._stream, "aclose"):
+            await self._stream.aclose()
+
+
+class PoolTransport(httpx.AsyncBaseTransport):
+    """httpx transport over a httpcore pool built here with every setting
+    passed explicitly, httpx.AsyncHTTPTransport doesn't take a network backend,
+    which the caching resolver needs."""
+
+    def __init__(
+        self,
+        limits: httpx.Limits,
+        ssl_context: ssl.SSLContext,
+        http2: bool = False,
+        retries: int = 0,
+        network_backend: httpcore.AsyncNetworkBackend | None = None,
+    ) -> None:
+        self.pool = httpcore.AsyncConnectionPool(
+            ssl_context=ssl_context,
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http1=True,
+            http2=http2,
+            retries=retries,
+            network_backend=network_backend,
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        with map_httpcore_exceptions():
+            core_response = await self.pool.handle_async_request(core_request)
+        return httpx.Response(
+            status_code=core_response.status,
+            headers=core_response.headers,
+            stream=PoolResponseStream(core_response.stream),
+            extensions=core_response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self.pool.aclose()
+
+
+class HTTPPool:
+    def __init__(self) -> None:
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("HTTP pool is not started")
+        return self._client
+
+    async def start(self) -> None:
+        http2 = cfg.HTTP_HTTP2
+        if http2 and find_spec("h2") is None:
+            logger.warning(
+                "HTTP/2 is enabled, but 'h2' isn't installed, using HTTP/1.1"
+            )
+            http2 = False
+
+        transport = PoolTransport(
+            limits=httpx.Limits(
+                max_connections=cfg.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=cfg.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=cfg.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            ssl_context=httpx.create_ssl_context(),
+            http2=http2,
+            retries=cfg.HTTP_RETRIES,
+            network_backend=(
+                ResolvingNetworkBackend(dns_resolver) if cfg.DNS_CACHE else None
+            ),
+        )
+
+        if cfg.TRACING_ENABLED:
+            transport = TracingTransport(transport)
+
+        self._client = httpx.AsyncClient(transport=transport, timeout=cfg.HTTP_TIMEOUT)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+http_pool = HTTPPool()
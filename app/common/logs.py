@@ -0,0 +1,127 @@
+import copy
+import json
+import logging
+import random
+import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Any
+
+from .config import cfg
+
+# update_id, chat_id and target_id of what is being handled now, tasks started
+# meanwhile (dispatcher, background tasks) get a copy
+log_context: ContextVar[dict[str, Any]] = ContextVar("log_context", default={})
+
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def bind(**fields: Any) -> None:
+    log_context.set({**log_context.get(), **fields})
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"wftb.{name}")
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        for field, value in log_context.get().items():
+            if not hasattr(record, field):
+                setattr(record, field, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a share of records of high-volume events, records are marked
+    with extra={"event": ...}. Warnings and errors are always kept."""
+
+    def __init__(self, rates: dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, "event", None), 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field, value in vars(record).items():
+            if field not in _RECORD_FIELDS:
+                data[field] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class StructuredQueueHandler(QueueHandler):
+    """QueueHandler flattens records into formatted text, this one keeps extra
+    fields and traceback apart for the formatter on the listener side."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class LogQueue:
+    """Records are put to a queue on the event loop and written to stdout by
+    a listener thread, so slow stdout doesn't block handling."""
+
+    def __init__(self) -> None:
+        self._listener: QueueListener | None = None
+
+    def start(self) -> None:
+        if self._listener is not None:
+            return
+
+        output = logging.StreamHandler(sys.stdout)
+        if cfg.LOG_FORMAT == "json":
+            output.setFormatter(JSONFormatter())
+        else:
+            output.setFormatter(
+                logging.Formatter("%(asctime)s - %(levelname)s:\t  %(message)s")
+            )
+
+        queue = SimpleQueue()
+        handler = StructuredQueueHandler(queue)
+        # sampled out records don't get context and don't reach the queue
+        handler.addFilter(SamplingFilter(cfg.LOG_SAMPLING))
+        handler.addFilter(ContextFilter())
+
+        logger = logging.getLogger("wftb")
+        logger.handlers = [handler]
+        logger.propagate = False
+        logger.setLevel(cfg.LOG_LEVEL)
+        for name, level in cfg.LOG_LEVELS.items():
+            logging.getLogger(name).setLevel(level)
+
+        self._listener = QueueListener(queue, output, respect_handler_level=True)
+        self._listener.start()
+
+    def stop(self) -> None:
+        if self._listener is None:
+            return
+        # writes what is left in the queue
+        self._listener.stop()
+        self._listener = None
+
+
+log_queue = LogQueue()
@@ -0,0 +1,85 @@
+from collections import deque
+from typing import Iterable
+
+
+class KeyMatcher:
+    """Aho-Corasick automaton over target keys: one pass over a text finds every
+    occurrence of every key."""
+
+    def __init__(self, keys: Iterable[str]) -> None:
+        self.keys = frozenset(key for key in keys if key)
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # keys ending in a state, including ones reachable by fail links
+        self._out: list[tuple[str, ...]] = [()]
+
+        for key in self.keys:
+            state = 0
+            for char in key:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = next_state
+            self._out[state] += (key,)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] += self._out[self._fail[next_state]]
+
+    def find(self, text: str) -> list[tuple[int, int, str]]:
+        """All (start, end, key) occurrences, overlapping ones included."""
+        if not self.keys:
+            return []
+
+        goto, fail, out = self._goto, self._fail, self._out
+        occurrences = []
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for key in out[state]:
+                occurrences.append((index + 1 - len(key), index + 1, key))
+        return occurrences
+
+    def match(self, text: str) -> set[str]:
+        return {key for _, _, key in self.find(text)}
+
+    def select(self, occurrences: list[tuple[int, int, str]]) -> list[tuple[int, int]]:
+        """Non-overlapping (start, end) ranges to remove, leftmost first and the
+        longest one of keys starting at the same position."""
+        ranges = []
+        position = 0
+        for start, end, _ in sorted(occurrences, key=lambda item: (item[0], -item[1])):
+            if start < position:
+                continue
+            ranges.append((start, end))
+            position = end
+        return ranges
+
+    def strip(
+        self, text: str, occurrences: list[tuple[int, int, str]] | None = None
+    ) -> str:
+        if occurrences is None:
+            occurrences = self.find(text)
+        if not occurrences:
+            return text
+
+        parts = []
+        position = 0
+        for start, end in self.select(occurrences):
+            parts.append(text[position:start])
+            position = end
+        parts.append(text[position:])
+        return "".join(parts)
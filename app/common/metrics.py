@@ -0,0 +1,97 @@
+import time
+from typing import Any, Callable
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 15, 30, 60)
+
+INGRESS_SECONDS = Histogram(
+    "wftb_ingress_seconds",
+    "Time of /webhooks/telegram route, by prefilter result",
+    ["result"],
+)
+MIDDLEWARE_SECONDS = Histogram(
+    "wftb_middleware_seconds",
+    "Time spent in middleware itself, without handlers after it",
+    ["middleware"],
+)
+PROBE_SECONDS = Histogram(
+    "wftb_scheme_probe_seconds", "Scheme resolution of links of a post"
+)
+MEDIA_GROUP_WAIT_SECONDS = Histogram(
+    "wftb_media_group_wait_seconds",
+    "Time from the first part of media group to its handling",
+    buckets=SLOW_BUCKETS,
+)
+HANDLER_SECONDS = Histogram("wftb_handler_seconds", "Time of handlers", ["handler"])
+DELIVERY_SECONDS = Histogram(
+    "wftb_delivery_seconds",
+    "Webhook request time, by target",
+    ["target_id"],
+    buckets=SLOW_BUCKETS,
+)
+DELIVERIES = Counter(
+    "wftb_deliveries", "Webhook requests, by target and status", ["target_id", "status"]
+)
+DB_QUERY_SECONDS = Histogram(
+    "wftb_db_query_seconds", "Database statement time", ["statement"]
+)
+
+
+class StatsCollector:
+    """Exposes numbers from stats() of caches and queues as gauges, read at
+    scrape time, so the hot path doesn't update them."""
+
+    def __init__(self) -> None:
+        self._sources: dict[str, Callable[[], dict[str, Any]]] = {}
+
+    def register(self, name: str, stats: Callable[[], dict[str, Any]]) -> None:
+        self._sources[name] = stats
+
+    def collect(self):
+        gauge = GaugeMetricFamily(
+            "wftb_stats",
+            "Sizes and counters of caches and queues",
+            labels=["source", "stat"],
+        )
+        for name, stats in self._sources.items():
+            for stat, value in stats().items():
+                if isinstance(value, (int, float)):
+                    gauge.add_metric([name, stat], value)
+        yield gauge
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        start = conn.info["query_start"].pop()
+        kind = statement.lstrip().split(" ", 1)[0].upper()
+        DB_QUERY_SECONDS.labels(kind).observe(time.perf_counter() - start)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get(
+            "query_start"
+        ):
+            context.connection.info["query_start"].pop()
+
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
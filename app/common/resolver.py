@@ -0,0 +1,177 @@
+import asyncio
+import ipaddress
+import socket
+import time
+import typing
+from contextlib import suppress
+from importlib.util import find_spec
+
+import httpcore
+import httpx
+
+from .config import cfg
+
+if find_spec("aiodns"):
+    import aiodns
+else:
+    aiodns = None
+
+
+class DNSResolver:
+    """Async resolver with a per-host cache. Uses c-ares (aiodns) when it's
+    installed, so lookups don't take executor threads and answers carry TTLs,
+    otherwise falls back to loop.getaddrinfo with the default TTL."""
+
+    def __init__(
+        self, ttl: float, min_ttl: float, max_ttl: float, negative_ttl: float
+    ) -> None:
+        self._ttl = ttl
+        self._min_ttl = min_ttl
+        self._max_ttl = max_ttl
+        self._negative_ttl = negative_ttl
+        # host -> (addresses, expires at), empty addresses for unknown hosts
+        self._cache: dict[str, tuple[list[str], float]] = {}
+        self._lookups: dict[str, asyncio.Future] = {}
+        self._resolver = None
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+        self.errors = 0
+
+    async def resolve(self, host: str) -> list[str]:
+        try:
+            ipaddress.ip_address(host)
+            return [host]
+        except ValueError:
+            pass
+
+        cached = self._cache.get(host)
+        if cached and cached[1] > time.monotonic():
+            self.hits += 1
+            addresses = cached[0]
+        else:
+            self.misses += 1
+            lookup = self._lookups.get(host)
+            if lookup is None:
+                lookup = asyncio.ensure_future(self._lookup(host))
+                self._lookups[host] = lookup
+            addresses = await asyncio.shield(lookup)
+
+        if not addresses:
+            raise httpcore.ConnectError(f"Can't resolve {host}")
+        return addresses
+
+    async def _lookup(self, host: str) -> list[str]:
+        try:
+            if aiodns is not None:
+                addresses, ttl = await self._query_aiodns(host)
+            else:
+                addresses, ttl = await self._query_system(host)
+            ttl = min(max(ttl, self._min_ttl), self._max_ttl)
+        except Exception:
+            self.errors += 1
+            addresses, ttl = [], self._negative_ttl
+        finally:
+            self._lookups.pop(host, None)
+
+        self._cache[host] = (addresses, time.monotonic() + ttl)
+        return addresses
+
+    async def _query_aiodns(self, host: str) -> tuple[list[str], float]:
+        if self._resolver is None:
+            self._resolver = aiodns.DNSResolver()
+        answer = await self._resolver.getaddrinfo(host, type=socket.SOCK_STREAM)
+        # ipv4 first, hosts without ipv6 route would wait for connect timeout
+        nodes = sorted(answer.nodes, key=lambda node: node.family != socket.AF_INET)
+        addresses = list(dict.fromkeys(node.addr[0].decode() for node in nodes))
+        ttl = min((node.ttl for node in nodes), default=self._ttl) or self._ttl
+        return addresses, ttl
+
+    async def _query_system(self, host: str) -> tuple[list[str], float]:
+        loop = asyncio.get_running_loop()
+        answer = await loop.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        answer = sorted(answer, key=lambda info: info[0] != socket.AF_INET)
+        return list(dict.fromkeys(info[4][0] for info in answer)), self._ttl
+
+    async def prefetch(self, urls: list[str]) -> None:
+        hosts = []
+        for url in urls:
+            with suppress(httpx.InvalidURL):
+                hosts.append(httpx.URL(url).host)
+        hosts = list(dict.fromkeys(host for host in hosts if host))
+        await asyncio.gather(
+            *[self.resolve(host) for host in hosts], return_exceptions=True
+        )
+        self.prefetched += len(hosts)
+
+    def stats(self) -> dict[str, int | str]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "prefetched": self.prefetched,
+            "errors": self.errors,
+            "size": len(self._cache),
+            "backend": "aiodns" if aiodns is not None else "system",
+        }
+
+
+class ResolvingNetworkBackend(httpcore.AsyncNetworkBackend):
+    """httpcore backend that connects to addresses from DNSResolver. TLS still
+    uses the original host name, httpcore passes it separately."""
+
+    def __init__(self, resolver: DNSResolver) -> None:
+        self._resolver = resolver
+        self._backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: float | None = None,
+        local_address: str | None = None,
+        socket_options: typing.Iterable[httpcore.SOCKET_OPTION] | None = None,
+    ) -> httpcore.AsyncNetworkStream:
+        # resolving and every address share the request's connect timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            async with asyncio.timeout(timeout):
+                addresses = await self._resolver.resolve(host)
+        except TimeoutError:
+            raise httpcore.ConnectTimeout(f"Resolving {host} timed out")
+
+        error = None
+        for address in addresses:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise httpcore.ConnectTimeout(f"Connecting to {host} timed out")
+            try:
+                return await self._backend.connect_tcp(
+                    address,
+                    port,
+                    timeout=remaining,
+                    local_address=local_address,
+                    socket_options=socket_options,
+                )
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        raise error
+
+    async def connect_unix_socket(
+        self,
+        path: str,
+        timeout: float | None = None,
+        socket_options: typing.Iterable[httpcore.SOCKET_OPTION] | None = None,
+    ) -> httpcore.AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(
+            path, timeout=timeout, socket_options=socket_options
+        )
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+dns_resolver = DNSResolver(
+    cfg.DNS_TTL, cfg.DNS_MIN_TTL, cfg.DNS_MAX_TTL, cfg.DNS_NEGATIVE_TTL
+)
@@ -0,0 +1,198 @@
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from queue import SimpleQueue
+from typing import Any, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .config import cfg
+from .logs import get_logger
+
+logger = get_logger(__name__)
+
+# span being handled now, None when there is no trace or it isn't sampled
+current_span: ContextVar[dict[str, Any] | None] = ContextVar(
+    "current_span", default=None
+)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class JSONFileExporter:
+    """Appends finished spans as JSON lines to a file from a background thread."""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._queue = SimpleQueue()
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def export(self, span: dict[str, Any]) -> None:
+        self._queue.put(span)
+
+    def _write(self) -> None:
+        with open(self._path, "a") as f:
+            while True:
+                span = self._queue.get()
+                if span is None:
+                    return
+                f.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+
+class LogExporter:
+    """Writes finished spans to the log, with the rest of structured records."""
+
+    def export(self, span: dict[str, Any]) -> None:
+        logger.info(f"Span {span['name']}", extra={"span": span})
+
+    def close(self) -> None:
+        pass
+
+
+EXPORTERS = {"file": lambda: JSONFileExporter(cfg.TRACING_PATH), "log": LogExporter}
+
+
+class Tracer:
+    """Spans are dicts linked by trace_id and parent_id, current one is kept in
+    a context variable, so tasks started inside a span continue its trace. The
+    sampling decision is made once per trace, at its root."""
+
+    def __init__(self) -> None:
+        self.exporter: JSONFileExporter | LogExporter | None = None
+        self.sample_rate = 0.0
+
+    def start(self) -> None:
+        if not cfg.TRACING_ENABLED or self.exporter is not None:
+            return
+        self.exporter = EXPORTERS[cfg.TRACING_EXPORTER]()
+        self.sample_rate = cfg.TRACING_SAMPLE_RATE
+
+    def stop(self) -> None:
+        if self.exporter is None:
+            return
+        self.exporter.close()
+        self.exporter = None
+
+    def context(self) -> dict[str, str] | None:
+        """Ids of current span, to continue the trace in another process or
+        in a task that doesn't inherit the context."""
+        span = current_span.get()
+        if span is None:
+            return None
+        return {"trace_id": span["trace_id"], "span_id": span["span_id"]}
+
+    def start_span(
+        self,
+        name: str,
+        parent: dict[str, str] | None = None,
+        start: float | None = None,
+        **attributes: Any,
+    ) -> dict[str, Any] | None:
+        """Span that isn't made current, for leaves like DB queries."""
+        if self.exporter is None:
+            return None
+        parent = parent or current_span.get()
+        if parent is None:
+            return None
+        return {
+            "trace_id": parent["trace_id"],
+            "span_id": _new_id(64),
+            "parent_id": parent["span_id"],
+            "name": name,
+            "start": start or time.time(),
+            "attributes": attributes,
+        }
+
+    def end_span(self, span: dict[str, Any] | None, error: Exception | None = None):
+        if span is None or self.exporter is None:
+            return
+        span["duration"] = time.time() - span["start"]
+        if error is not None:
+            span["error"] = f"{type(error).__name__}: {error}"
+        self.exporter.export(span)
+
+    @contextmanager
+    def trace(self, name: str, **attributes: Any) -> Iterator[dict[str, Any] | None]:
+        """Root span of a new trace, sampled. Only for where work comes in, the
+        rest continues a trace, so the sampling decision stays at the root."""
+        span = None
+        if self.exporter is not None and random.random() < self.sample_rate:
+            span = {
+                "trace_id": _new_id(128),
+                "span_id": _new_id(64),
+                "parent_id": None,
+                "name": name,
+                "start": time.time(),
+                "attributes": attributes,
+            }
+        with self._current(span):
+            yield span
+
+    @contextmanager
+    def continue_trace(
+        self, name: str, parent: dict[str, str] | None, **attributes: Any
+    ) -> Iterator[dict[str, Any] | None]:
+        """Span continuing the trace of parent context, none when the root
+        wasn't sampled and there is no parent."""
+        span = None
+        if parent is not None:
+            span = self.start_span(name, parent, **attributes)
+        with self._current(span):
+            yield span
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[dict[str, Any] | None]:
+        with self._current(self.start_span(name, **attributes)) as span:
+            yield span
+
+    @contextmanager
+    def _current(self, span: dict[str, Any] | None) -> Iterator[dict[str, Any] | None]:
+        if span is None:
+            yield None
+            return
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            current_span.reset(token)
+            self.end_span(span)
+
+
+tracer = Tracer()
+
+
+def trace_engine(engine: AsyncEngine) -> None:
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        span = tracer.start_span("db", statement=statement)
+        conn.info.setdefault("trace_spans", []).append(span)
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        tracer.end_span(conn.info["trace_spans"].pop())
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get(
+            "trace_spans"
+        ):
+            tracer.end_span(
+                context.connection.info["trace_spans"].pop(),
+                context.original_exception,
+            )
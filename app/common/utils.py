@@ -1,3 +1,5 @@
+from hmac import compare_digest
+
 from fastapi import HTTPException, Request
 from fastapi.responses import JSONResponse
 
@@ -10,6 +12,14 @@ async def verify_telegram_secret(request: Request) -> None:
         raise HTTPException(status_code=401, detail="NOT VERIFIED")
 
 
+async def verify_metrics_token(request: Request) -> None:
+    if cfg.METRICS_TOKEN is None:
+        return
+    header = request.headers.get("Authorization", "")
+    if not compare_digest(header.encode(), f"Bearer {cfg.METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="NOT VERIFIED")
+
+
 async def server_error(request, exc) -> JSONResponse:
     return JSONResponse(status_code=500, content={"detail": "Internal server error"})
 
@@ -1,50 +1,152 @@
+from typing import Any
+
+from cachetools import TTLCache
+from crud.routing import bump_version, routing_table
+from crud.targets import routing_cache
 from db.models import Chats, Targets
-from db.utils import async_session
-from sqlalchemy import delete, insert, select
+from db.utils import async_read_session, async_session, dialect_insert
+from sqlalchemy import delete, select
+
+_UNKNOWN = object()
+
+
+class ChatDirectory:
+    """Owners of recently used chats and the prefilter allowlist, only used when
+    the routing snapshot is off, lookups and updates skip it while the snapshot
+    is loaded."""
+
+    def __init__(
+        self, ttl: float = 300.0, negative_ttl: float = 10.0, maxsize: int = 10000
+    ) -> None:
+        # chat_id -> owner_id and owner_id -> owned chat ids
+        self._owners = TTLCache(ttl=ttl, maxsize=maxsize)
+        self._owned = TTLCache(ttl=ttl, maxsize=maxsize)
+        # unknown ids live shorter, so a later /start or channel add shows up soon
+        # even if it was handled by another process
+        self._missing_chats = TTLCache(ttl=negative_ttl, maxsize=maxsize)
+        self._missing_owners = TTLCache(ttl=negative_ttl, maxsize=maxsize)
+        # every registered chat_id -> owner_id, for the ingress prefilter
+        self._allowlist: dict[int, int] | None = None
+        self._allowed_owners: set[int] = set()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, value: Any) -> Any:
+        if value is _UNKNOWN:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get_owner(self, chat_id: int) -> Any:
+        if chat_id in self._missing_chats:
+            return self._count(None)
+        return self._count(self._owners.get(chat_id, _UNKNOWN))
+
+    def put_owner(self, chat_id: int, owner_id: int | None, generation: int) -> None:
+        if generation != self.generation:
+            return
+        if owner_id is None:
+            self._missing_chats[chat_id] = True
+        else:
+            self._owners[chat_id] = owner_id
+
+    def get_owned_chats(self, owner_id: int) -> Any:
+        if owner_id in self._missing_owners:
+            return self._count(())
+        return self._count(self._owned.get(owner_id, _UNKNOWN))
+
+    def put_owned_chats(
+        self, owner_id: int, chat_ids: tuple[int, ...], generation: int
+    ) -> None:
+        if generation != self.generation:
+            return
+        if not chat_ids:
+            self._missing_owners[owner_id] = True
+        else:
+            self._owned[owner_id] = chat_ids
+
+    def load_allowlist(self, chats: dict[int, int], generation: int) -> None:
+        if generation != self.generation:
+            return
+        self._allowlist = chats
+        self._allowed_owners = set(chats.values())
+
+    def is_allowed_chat(self, chat_id: int) -> bool | None:
+        """None until allowlist is loaded."""
+        if self._allowlist is None:
+            return None
+        return chat_id in self._allowlist
+
+    def is_allowed_owner(self, owner_id: int) -> bool | None:
+        if self._allowlist is None:
+            return None
+        return owner_id in self._allowed_owners
+
+    def chat_added(self, chat_id: int, owner_id: int) -> None:
+        self.generation += 1
+        self._missing_chats.pop(chat_id, None)
+        self._missing_owners.pop(owner_id, None)
+        self._owned.pop(owner_id, None)
+        self._owners[chat_id] = owner_id
+        if self._allowlist is not None:
+            self._allowlist[chat_id] = owner_id
+            self._allowed_owners.add(owner_id)
+
+    def chats_removed(self, chat_ids: list[int]) -> None:
+        self.generation += 1
+        for chat_id in chat_ids:
+            self._owners.pop(chat_id, None)
+        self._owned.clear()
+        if self._allowlist is not None:
+            for chat_id in chat_ids:
+                self._allowlist.pop(chat_id, None)
+            self._allowed_owners = set(self._allowlist.values())
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "chats": len(self._owners),
+            "owners": len(self._owned),
+            "missing_chats": len(self._missing_chats),
+            "missing_owners": len(self._missing_owners),
+            "allowlist": len(self._allowlist or {}),
+        }
+
+
+chat_directory = ChatDirectory()
 
 
 async def chat_exists(chat_id: int) -> bool:
-    async with async_session() as session:
-        async with session.begin():
-            db_chat = await session.scalar(select(Chats).where(Chats.id == chat_id))
-            if db_chat:
-                return True
-            return False
+    return (await get_owner(chat_id)) is not None
 
 
 async def owner_exists(owner_id: int) -> bool:
-    async with async_session() as session:
-        async with session.begin():
-            db_chat = await session.scalar(
-                select(Chats).where(Chats.owner_id == owner_id)
-            )
-            if db_chat:
-                return True
-            return False
+    return bool(await get_owned_chats(owner_id))
 
 
 async def check_ownership(chat_id: int, owner_id: int) -> bool:
-    async with async_session() as session:
-        async with session.begin():
-            db_chat = await session.scalar(
-                select(Chats).where(Chats.owner_id == owner_id, Chats.id == chat_id)
-            )
-            if db_chat:
-                return True
-            return False
+    return (await get_owner(chat_id)) == owner_id
 
 
 async def add_chat(chat_id: int, owner_id: int) -> bool:
     async with async_session() as session:
         async with session.begin():
-            db_chat = await session.scalar(select(Chats).where(Chats.id == chat_id))
-            if db_chat:
-                return False
-
-            await session.execute(
-                insert(Chats).values({"id": chat_id, "owner_id": owner_id})
+            added_id = await session.scalar(
+                dialect_insert(Chats)
+                .values({"id": chat_id, "owner_id": owner_id})
+                .on_conflict_do_nothing(index_elements=[Chats.id])
+                .returning(Chats.id)
             )
-            return True
+            if added_id is None:
+                return False
+            await bump_version(session)
+        if routing_table.snapshot is None:
+            chat_directory.chat_added(chat_id, owner_id)
+        await routing_table.changed()
+        return True
 
 
 async def remove_chats(chat_ids: list[int]) -> None:
@@ -52,22 +154,55 @@ async def remove_chats(chat_ids: list[int]) -> None:
         async with session.begin():
             await session.execute(delete(Targets).where(Targets.chat_id.in_(chat_ids)))
             await session.execute(delete(Chats).where(Chats.id.in_(chat_ids)))
+            await bump_version(session)
+        if routing_table.snapshot is None:
+            chat_directory.chats_removed(chat_ids)
+            for chat_id in chat_ids:
+                routing_cache.invalidate(chat_id)
+        await routing_table.changed()
 
 
 async def get_owned_chats(owner_id: int) -> list[int]:
-    async with async_session() as session:
-        async with session.begin():
-            db_chats = await session.scalars(
-                select(Chats).where(Chats.owner_id == owner_id)
-            )
+    if routing_table.snapshot is not None:
+        return list(routing_table.snapshot.owned.get(owner_id, ()))
+
+    chat_ids = chat_directory.get_owned_chats(owner_id)
+    if chat_ids is not _UNKNOWN:
+        return list(chat_ids)
 
-            return [chat.id for chat in db_chats]
+    generation = chat_directory.generation
+    async with async_read_session() as session:
+        db_chat_ids = await session.scalars(
+            select(Chats.id).where(Chats.owner_id == owner_id)
+        )
+        chat_ids = tuple(db_chat_ids)
+
+    chat_directory.put_owned_chats(owner_id, chat_ids, generation)
+    return list(chat_ids)
 
 
 async def get_owner(chat_id: int) -> int:
-    async with async_session() as session:
-        async with session.begin():
-            db_chat = await session.scalar(select(Chats).where(Chats.id == chat_id))
-            if not db_chat:
-                return None
-            return db_chat.owner_id
+    if routing_table.snapshot is not None:
+        return routing_table.snapshot.owners.get(chat_id)
+
+    owner_id = chat_directory.get_owner(chat_id)
+    if owner_id is not _UNKNOWN:
+        return owner_id
+
+    generation = chat_directory.generation
+    async with async_read_session() as session:
+        owner_id = await session.scalar(
+            select(Chats.owner_id).where(Chats.id == chat_id)
+        )
+
+    chat_directory.put_owner(chat_id, owner_id, generation)
+    return owner_id
+
+
+async def load_allowlist() -> None:
+    generation = chat_directory.generation
+    async with async_read_session() as session:
+        db_chats = await session.execute(select(Chats.id, Chats.owner_id))
+        chats = {chat_id: owner_id for chat_id, owner_id in db_chats}
+
+    chat_directory.load_allowlist(chats, generation)
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from db.models import Deliveries
+from db.utils import async_session
+from sqlalchemy import delete, insert, select, update
+
+
+async def enqueue_deliveries(deliveries: list[dict[str, Any]]) -> None:
+    if not deliveries:
+        return
+
+    now = datetime.now(timezone.utc)
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                insert(Deliveries).values(
+                    [
+                        {
+                            "chat_id": delivery["chat_id"],
+                            "target_id": delivery["target_id"],
+                            "webhook": delivery["webhook"],
+                            "payload": delivery["payload"],
+                            "attempts": 0,
+                            "next_attempt_at": now,
+                            "created_at": now,
+                        }
+                        for delivery in deliveries
+                    ]
+                )
+            )
+
+
+async def claim_deliveries(limit: int, lease: float) -> list[dict[str, Any]]:
+    # claimed rows are hidden from other workers until the lease expires, so
+    # deliveries of a crashed process are picked up again
+    now = datetime.now(timezone.utc)
+    async with async_session() as session:
+        async with session.begin():
+            db_ids = await session.scalars(
+                select(Deliveries.id)
+                .where(Deliveries.next_attempt_at <= now)
+                .order_by(Deliveries.next_attempt_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            ids = list(db_ids)
+            if not ids:
+                return []
+
+            db_deliveries = await session.execute(
+                update(Deliveries)
+                .where(Deliveries.id.in_(ids), Deliveries.next_attempt_at <= now)
+                .values(
+                    {
+                        "attempts": Deliveries.attempts + 1,
+                        "next_attempt_at": now + timedelta(seconds=lease),
+                    }
+                )
+                .returning(
+                    Deliveries.id,
+                    Deliveries.chat_id,
+                    Deliveries.target_id,
+                    Deliveries.webhook,
+                    Deliveries.payload,
+                    Deliveries.attempts,
+                )
+            )
+
+            return [
+                {
+                    "id": delivery.id,
+                    "chat_id": delivery.chat_id,
+                    "target_id": delivery.target_id,
+                    "webhook": delivery.webhook,
+                    "payload": delivery.payload,
+                    "attempts": delivery.attempts,
+                }
+                for delivery in db_deliveries
+            ]
+
+
+async def remove_deliveries(ids: list[int]) -> None:
+    if not ids:
+        return
+
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(delete(Deliveries).where(Deliveries.id.in_(ids)))
+
+
+async def reschedule_delivery(id: int, delay: float) -> None:
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                update(Deliveries)
+                .where(Deliveries.id == id)
+                .values(
+                    {
+                        "next_attempt_at": datetime.now(timezone.utc)
+                        + timedelta(seconds=delay)
+                    }
+                )
+            )
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from db.models import MediaGroupParts, MediaGroups
+from db.utils import async_session, dialect_insert
+from sqlalchemy import delete, select, update
+
+
+async def add_media_group_part(
+    media_group_id: str, message_id: int, payload: dict[str, Any]
+) -> bool:
+    """False if the group was claimed already, the part came too late for it."""
+    now = datetime.now(timezone.utc)
+    async with async_session() as session:
+        async with session.begin():
+            insert_group = dialect_insert(MediaGroups).values(
+                {
+                    "id": media_group_id,
+                    "first_seen": now,
+                    "last_seen": now,
+                    "claimed": False,
+                }
+            )
+            # the upsert locks the group row until commit, so a claim waits for
+            # the part, and a claimed group isn't updated, nothing is returned
+            group_id = await session.scalar(
+                insert_group.on_conflict_do_update(
+                    index_elements=[MediaGroups.id],
+                    set_={"last_seen": now},
+                    where=MediaGroups.claimed == False,
+                ).returning(MediaGroups.id)
+            )
+            if group_id is None:
+                return False
+            insert_part = dialect_insert(MediaGroupParts).values(
+                {
+                    "media_group_id": media_group_id,
+                    "message_id": message_id,
+                    "payload": payload,
+                }
+            )
+            await session.execute(insert_part.on_conflict_do_nothing())
+        return True
+
+
+async def claim_media_group(
+    media_group_id: str, quiet_window: float, max_wait: float
+) -> list[dict[str, Any]] | float | None:
+    """Returns group parts if this call claimed the group, seconds to wait if the
+    group is still receiving parts and None if it was claimed by someone else."""
+    now = datetime.now(timezone.utc)
+    async with async_session() as session:
+        async with session.begin():
+            claimed_id = await session.scalar(
+                update(MediaGroups)
+                .where(
+                    MediaGroups.id == media_group_id,
+                    MediaGroups.claimed == False,
+                    (MediaGroups.last_seen <= now - timedelta(seconds=quiet_window))
+                    | (MediaGroups.first_seen <= now - timedelta(seconds=max_wait)),
+                )
+                .values({"claimed": True})
+                .returning(MediaGroups.id)
+            )
+            if claimed_id is None:
+                db_group = await session.scalar(
+                    select(MediaGroups).where(MediaGroups.id == media_group_id)
+                )
+                if not db_group or db_group.claimed:
+                    return None
+                # sqlite gives back naive datetimes, all of them are in utc
+                last_seen = db_group.last_seen.replace(tzinfo=timezone.utc)
+                first_seen = db_group.first_seen.replace(tzinfo=timezone.utc)
+                flush_at = min(
+                    last_seen + timedelta(seconds=quiet_window),
+                    first_seen + timedelta(seconds=max_wait),
+                )
+                return max((flush_at - now).total_seconds(), 0.0)
+
+            # parts are taken in the same statement that removes them, so none
+            # committed meanwhile is removed without being returned
+            db_parts = await session.execute(
+                delete(MediaGroupParts)
+                .where(MediaGroupParts.media_group_id == media_group_id)
+                .returning(MediaGroupParts.message_id, MediaGroupParts.payload)
+            )
+            # the claimed group stays until it's stale, so late parts are
+            # rejected instead of starting a new group
+            return [
+                payload for _, payload in sorted(db_parts, key=lambda part: part[0])
+            ]
+
+
+async def remove_stale_media_groups(older_than: float) -> None:
+    # groups whose only receiving process died before flushing them
+    expired = datetime.now(timezone.utc) - timedelta(seconds=older_than)
+    async with async_session() as session:
+        async with session.begin():
+            stale_ids = select(MediaGroups.id).where(MediaGroups.first_seen < expired)
+            await session.execute(
+                delete(MediaGroupParts).where(
+                    MediaGroupParts.media_group_id.in_(stale_ids)
+                )
+            )
+            await session.execute(
+                delete(MediaGroups).where(MediaGroups.first_seen < expired)
+            )
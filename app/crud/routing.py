@@ -0,0 +1,200 @@
+import asyncio
+from collections import defaultdict
+from types import MappingProxyType
+from typing import Any
+
+from common.config import cfg
+from common.logs import get_logger
+from common.matcher import KeyMatcher
+from db.models import Chats, RoutingVersion, Targets
+from db.utils import _engine, async_read_session, dialect_insert
+from sqlalchemy import func, select
+
+logger = get_logger(__name__)
+
+NOTIFY_CHANNEL = "wftb_routing"
+
+
+def build_routing(chat_targets: list[dict[str, Any]]) -> dict[str, Any]:
+    keys = frozenset(target["key"] for target in chat_targets if target["key"])
+    return {"targets": chat_targets, "keys": keys, "matcher": KeyMatcher(keys)}
+
+
+EMPTY_ROUTING = MappingProxyType(build_routing(()))
+
+
+async def bump_version(session) -> None:
+    """Must run in the transaction of the chat or target change, so other
+    processes see the new version together with the change."""
+    # upsert, databases made without migrations have no version row
+    version = await session.scalar(
+        dialect_insert(RoutingVersion)
+        .values({"id": 1, "version": 1})
+        .on_conflict_do_update(
+            index_elements=[RoutingVersion.id],
+            set_={"version": RoutingVersion.version + 1},
+        )
+        .returning(RoutingVersion.version)
+    )
+    if _engine.dialect.name == "postgresql":
+        # delivered on commit
+        await session.execute(select(func.pg_notify(NOTIFY_CHANNEL, str(version))))
+
+
+class RoutingSnapshot:
+    """Every chat and target at one routing version, never changed after it's
+    built, a new version gets a new snapshot."""
+
+    def __init__(
+        self,
+        version: int,
+        chats: list[tuple[int, int]],
+        targets: list[dict[str, Any]],
+    ) -> None:
+        self.version = version
+        owned = defaultdict(list)
+        for chat_id, owner_id in chats:
+            owned[owner_id].append(chat_id)
+        chat_targets = defaultdict(list)
+        for target in targets:
+            chat_targets[target.pop("chat_id")].append(target)
+
+        # chat_id -> owner_id, owner_id -> owned chat ids, chat_id -> routing
+        self.owners = MappingProxyType(dict(chats))
+        self.owned = MappingProxyType(
+            {owner_id: tuple(chat_ids) for owner_id, chat_ids in owned.items()}
+        )
+        self.routing = MappingProxyType(
+            {
+                chat_id: MappingProxyType(build_routing(tuple(targets)))
+                for chat_id, targets in chat_targets.items()
+            }
+        )
+        self.targets = len(targets)
+
+    def get_routing(self, chat_id: int) -> dict[str, Any]:
+        return self.routing.get(chat_id, EMPTY_ROUTING)
+
+    def is_allowed_chat(self, chat_id: int) -> bool:
+        return chat_id in self.owners
+
+    def is_allowed_owner(self, owner_id: int) -> bool:
+        return owner_id in self.owned
+
+
+class RoutingTable:
+    """Holds the snapshot of this process. It's reloaded only when the routing
+    version in the database changes, which is checked by a cheap periodic query
+    or, on Postgres, right away on NOTIFY."""
+
+    def __init__(self) -> None:
+        self.snapshot: RoutingSnapshot | None = None
+        self._lock = asyncio.Lock()
+        self._notified = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._listen_connection = None
+        self.polls = 0
+        self.loads = 0
+
+    async def start(self) -> None:
+        if not cfg.ROUTING_SNAPSHOT or self._task is not None:
+            return
+        await self.refresh()
+        self._task = asyncio.create_task(self._poll())
+        if cfg.ROUTING_LISTEN and _engine.dialect.driver == "asyncpg":
+            try:
+                await self._listen()
+            except Exception as e:
+                logger.warning(f"Routing LISTEN failed, polling only - {type(e)} {e}")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        if self._listen_connection is not None:
+            raw_connection = await self._listen_connection.get_raw_connection()
+            await raw_connection.driver_connection.remove_listener(
+                NOTIFY_CHANNEL, self._on_notify
+            )
+            await self._listen_connection.close()
+            self._listen_connection = None
+        self.snapshot = None
+
+    async def changed(self) -> None:
+        """After a change made by this process, which sees it right away. The
+        change is committed already, so a failed refresh is only logged, the
+        poll picks the change up."""
+        if self._task is None:
+            return
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.error(f"Routing snapshot refresh failed - {type(e)} {e}")
+
+    async def refresh(self) -> None:
+        async with self._lock:
+            async with async_read_session() as session:
+                self.polls += 1
+                # version is read first, data read after it can only be newer
+                version = await session.scalar(
+                    select(RoutingVersion.version).where(RoutingVersion.id == 1)
+                )
+                version = version or 0
+                if self.snapshot is not None and self.snapshot.version == version:
+                    return
+
+                db_chats = await session.execute(select(Chats.id, Chats.owner_id))
+                db_targets = await session.execute(
+                    select(
+                        Targets.id,
+                        Targets.webhook,
+                        Targets.name,
+                        Targets.chat_id,
+                        Targets.key,
+                        Targets.prefix,
+                        Targets.always_link_preview,
+                    ).order_by(Targets.id)
+                )
+                chats = [tuple(chat) for chat in db_chats]
+                targets = [target._asdict() for target in db_targets]
+
+            self.snapshot = RoutingSnapshot(version, chats, targets)
+            self.loads += 1
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._notified.wait(), cfg.ROUTING_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._notified.clear()
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Routing snapshot refresh failed - {type(e)} {e}")
+
+    async def _listen(self) -> None:
+        # own connection, it's held by the listener until stop
+        self._listen_connection = await _engine.connect()
+        raw_connection = await self._listen_connection.get_raw_connection()
+        await raw_connection.driver_connection.add_listener(
+            NOTIFY_CHANNEL, self._on_notify
+        )
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        self._notified.set()
+
+    def stats(self) -> dict[str, int]:
+        snapshot = self.snapshot
+        return {
+            "version": snapshot.version if snapshot else -1,
+            "chats": len(snapshot.owners) if snapshot else 0,
+            "targets": snapshot.targets if snapshot else 0,
+            "polls": self.polls,
+            "loads": self.loads,
+        }
+
+
+routing_table = RoutingTable()
@@ -1,17 +1,57 @@
+from typing import Any
+
+from cachetools import TTLCache
+from crud.routing import build_routing, bump_version, routing_table
 from db.models import Targets
-from db.utils import async_session
-from sqlalchemy import delete, insert, select, update
+from db.utils import async_read_session, async_session, dialect_insert
+from sqlalchemy import delete, exists, select, update
+
+
+class RoutingCache:
+    """Routing of recently used chats, only used when the routing snapshot is
+    off, lookups and invalidations skip it while the snapshot is loaded."""
+
+    def __init__(self, ttl: float = 60.0, maxsize: int = 10000) -> None:
+        self._cache = TTLCache(ttl=ttl, maxsize=maxsize)
+        # bumped on every invalidation, so a lookup that started before a write
+        # can't put stale targets back into the cache
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chat_id: int) -> dict[str, Any] | None:
+        routing = self._cache.get(chat_id)
+        if routing is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return routing
+
+    def put(self, chat_id: int, routing: dict[str, Any], generation: int) -> None:
+        if generation == self.generation:
+            self._cache[chat_id] = routing
+
+    def invalidate(self, chat_id: int | None = None) -> None:
+        self.generation += 1
+        if chat_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(chat_id, None)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._cache),
+        }
+
+
+routing_cache = RoutingCache()
 
 
 async def check_webhook(webhook: str) -> bool:
-    async with async_session() as session:
-        async with session.begin():
-            db_target = await session.scalar(
-                select(Targets).where(Targets.webhook == webhook)
-            )
-            if db_target:
-                return True
-            return False
+    async with async_read_session() as session:
+        return await session.scalar(select(exists().where(Targets.webhook == webhook)))
 
 
 async def add_target(
@@ -24,16 +64,10 @@ async def add_target(
 ) -> bool:
     async with async_session() as session:
         async with session.begin():
-            db_target = await session.scalar(
-                select(Targets).where(
-                    Targets.webhook == webhook, Targets.chat_id == chat_id
-                )
-            )
-            if db_target:
-                return False
-
-            await session.execute(
-                insert(Targets).values(
+            # no row is returned when the webhook is already taken
+            target_id = await session.scalar(
+                dialect_insert(Targets)
+                .values(
                     {
                         "webhook": webhook,
                         "name": name,
@@ -43,8 +77,16 @@ async def add_target(
                         "always_link_preview": always_link_preview,
                     }
                 )
+                .on_conflict_do_nothing(index_elements=[Targets.webhook])
+                .returning(Targets.id)
             )
-            return True
+            if target_id is None:
+                return False
+            await bump_version(session)
+        if routing_table.snapshot is None:
+            routing_cache.invalidate(chat_id)
+        await routing_table.changed()
+        return True
 
 
 async def remove_target(id: int, chat_id: int) -> None:
@@ -53,38 +95,63 @@ async def remove_target(id: int, chat_id: int) -> None:
             await session.execute(
                 delete(Targets).where(Targets.id == id, Targets.chat_id == chat_id)
             )
+            await bump_version(session)
+        if routing_table.snapshot is None:
+            routing_cache.invalidate(chat_id)
+        await routing_table.changed()
 
 
-async def update_target(target_id: int, update_data: dict[str, str]) -> None:
+async def update_target(target_id: int, update_data: dict[str, str]) -> bool:
     async with async_session() as session:
         async with session.begin():
-            db_target = await session.scalar(
-                select(Targets).where(Targets.id == target_id)
+            chat_id = await session.scalar(
+                update(Targets)
+                .where(Targets.id == target_id)
+                .values(update_data)
+                .returning(Targets.chat_id)
             )
-            if not db_target:
+            if chat_id is None:
                 return False
-
-            await session.execute(
-                update(Targets).where(Targets.id == target_id).values(update_data)
-            )
-            return True
+            await bump_version(session)
+        if routing_table.snapshot is None:
+            if "chat_id" in update_data:
+                routing_cache.invalidate()
+            else:
+                routing_cache.invalidate(chat_id)
+        await routing_table.changed()
+        return True
 
 
 async def get_targets(chat_id: int) -> dict[str, dict[str, str]]:
-    async with async_session() as session:
-        async with session.begin():
-            db_targets = await session.scalars(
-                select(Targets).where(Targets.chat_id == chat_id)
-            )
+    async with async_read_session() as session:
+        db_targets = await session.execute(
+            select(
+                Targets.id,
+                Targets.webhook,
+                Targets.name,
+                Targets.key,
+                Targets.prefix,
+                Targets.always_link_preview,
+            ).where(Targets.chat_id == chat_id)
+        )
+        return [target._asdict() for target in db_targets]
+
+
+async def get_webhooks() -> list[str]:
+    async with async_read_session() as session:
+        db_webhooks = await session.scalars(select(Targets.webhook))
+        return list(db_webhooks)
+
+
+async def get_routing(chat_id: int) -> dict[str, Any]:
+    if routing_table.snapshot is not None:
+        return routing_table.snapshot.get_routing(chat_id)
+
+    routing = routing_cache.get(chat_id)
+    if routing is not None:
+        return routing
 
-            return [
-                {
-                    "id": target.id,
-                    "webhook": target.webhook,
-                    "name": target.name,
-                    "key": target.key,
-                    "prefix": target.prefix,
-                    "always_link_preview": target.always_link_preview,
-                }
-                for target in db_targets
-            ]
+    generation = routing_cache.generation
+    routing = build_routing(await get_targets(chat_id))
+    routing_cache.put(chat_id, routing, generation)
+    return routing
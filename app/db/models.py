@@ -1,6 +1,8 @@
+from datetime import datetime
+
 from sqlalchemy import MetaData
 from sqlalchemy.orm import Mapped, declarative_base, mapped_column
-from sqlalchemy.types import BIGINT, Text
+from sqlalchemy.types import BIGINT, JSON, DateTime, Text
 
 SCHEMA = "wftb"
 Base = declarative_base(metadata=MetaData(schema=SCHEMA))
@@ -10,7 +12,7 @@ class Chats(Base):
     __tablename__ = "chats"
 
     id: Mapped[int] = mapped_column(BIGINT, primary_key=True, autoincrement=False)
-    owner_id: Mapped[int] = mapped_column(BIGINT, nullable=False)
+    owner_id: Mapped[int] = mapped_column(BIGINT, nullable=False, index=True)
 
 
 class Targets(Base):
@@ -19,7 +21,50 @@ class Targets(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     webhook: Mapped[str] = mapped_column(Text, nullable=False, unique=True)
     name: Mapped[str] = mapped_column(nullable=False)
-    chat_id: Mapped[int] = mapped_column(BIGINT, nullable=False)
-    key: Mapped[str]
-    prefix: Mapped[str]
+    chat_id: Mapped[int] = mapped_column(BIGINT, nullable=False, index=True)
+    key: Mapped[str | None]
+    prefix: Mapped[str | None]
     always_link_preview: Mapped[bool] = mapped_column(nullable=False)
+
+
+class Deliveries(Base):
+    __tablename__ = "deliveries"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    chat_id: Mapped[int] = mapped_column(BIGINT, nullable=False)
+    target_id: Mapped[int] = mapped_column(nullable=False)
+    webhook: Mapped[str] = mapped_column(Text, nullable=False)
+    payload: Mapped[dict] = mapped_column(JSON, nullable=False)
+    attempts: Mapped[int] = mapped_column(nullable=False, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, index=True
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
+
+
+class MediaGroups(Base):
+    __tablename__ = "media_groups"
+
+    id: Mapped[str] = mapped_column(Text, primary_key=True)
+    first_seen: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
+    last_seen: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    claimed: Mapped[bool] = mapped_column(nullable=False, default=False)
+
+
+class MediaGroupParts(Base):
+    __tablename__ = "media_group_parts"
+
+    media_group_id: Mapped[str] = mapped_column(Text, primary_key=True)
+    message_id: Mapped[int] = mapped_column(BIGINT, primary_key=True)
+    payload: Mapped[dict] = mapped_column(JSON, nullable=False)
+
+
+class RoutingVersion(Base):
+    __tablename__ = "routing_version"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    version: Mapped[int] = mapped_column(BIGINT, nullable=False)
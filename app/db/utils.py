@@ -1,9 +1,90 @@
 from common.config import cfg
+from common.logs import get_logger
+from common.metrics import instrument_engine
+from common.tracing import trace_engine
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.sql import text
 
-_engine = create_async_engine(cfg.DB_CONNECTION_STRING)
+logger = get_logger(__name__)
+
+
+def _pool_options(pool_size: int) -> dict:
+    return {
+        "pool_size": pool_size,
+        "max_overflow": cfg.DB_MAX_OVERFLOW,
+        "pool_timeout": cfg.DB_POOL_TIMEOUT,
+        "pool_recycle": cfg.DB_POOL_RECYCLE,
+        "pool_pre_ping": cfg.DB_POOL_PRE_PING,
+    }
+
+
+def _sqlite_profile(query_only: bool):
+    def set_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={cfg.DB_SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={cfg.DB_SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={cfg.DB_SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={cfg.DB_SQLITE_BUSY_TIMEOUT}")
+        if query_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return set_pragmas
+
+
+_url = make_url(cfg.DB_CONNECTION_STRING)
+if _url.get_backend_name() == "sqlite":
+    # sqlite has no schemas, tables of "wftb" schema live in the main database
+    _sqlite_options = {"execution_options": {"schema_translate_map": {"wftb": None}}}
+    if not _url.database or _url.database == ":memory:":
+        # single shared connection, nothing to tune
+        _engine = create_async_engine(_url, **_sqlite_options)
+        _read_engine = _engine
+    else:
+        _engine = create_async_engine(
+            _url, **_sqlite_options, **_pool_options(cfg.DB_POOL_SIZE)
+        )
+        # readers don't wait for the writer in WAL mode, so lookups get their
+        # own connections, which can't write
+        _read_engine = create_async_engine(
+            _url, **_sqlite_options, **_pool_options(cfg.DB_READ_POOL_SIZE)
+        )
+        event.listen(_engine.sync_engine, "connect", _sqlite_profile(False))
+        event.listen(_read_engine.sync_engine, "connect", _sqlite_profile(True))
+else:
+    _connect_args = {}
+    if _url.get_driver_name() == "asyncpg":
+        # 0 is needed behind pgbouncer in transaction mode
+        _connect_args = {
+            "statement_cache_size": cfg.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": cfg.DB_STATEMENT_CACHE_SIZE,
+        }
+    _engine = create_async_engine(
+        _url, connect_args=_connect_args, **_pool_options(cfg.DB_POOL_SIZE)
+    )
+    _read_engine = _engine
+
+for engine in {_engine, _read_engine}:
+    instrument_engine(engine)
+    trace_engine(engine)
 async_session = async_sessionmaker(_engine, expire_on_commit=False)
+# lookups of the hot path, separate connections only on sqlite
+async_read_session = async_sessionmaker(_read_engine, expire_on_commit=False)
+
+
+async def dispose_engines() -> None:
+    for engine in {_engine, _read_engine}:
+        await engine.dispose()
+
+
+def dialect_insert(table):
+    # plain insert has no ON CONFLICT, dialect ones have
+    if _engine.dialect.name == "sqlite":
+        return sqlite.insert(table)
+    return postgresql.insert(table)
 
 
 async def check_db() -> None:
@@ -13,10 +94,7 @@ async def check_db() -> None:
             if "sqlite+aiosqlite:///" in cfg.DB_CONNECTION_STRING:
                 select_version = text("SELECT sqlite_version();")
             answer = await session.execute(select_version)
-            print(
-                f"INFO:\t  Successfully connecting to database.\n\t  {answer.first()}",
-                flush=True,
-            )
+            logger.info(f"Successfully connecting to database - {answer.first()}")
     except Exception as e:
-        print(f"ERROR:\t  Failed to connect to database:\n{str(e)}", flush=True)
+        logger.error(f"Failed to connect to database - {str(e)}")
         raise
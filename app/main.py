@@ -1,3 +1,4 @@
+import time
 from argparse import ArgumentParser
 from contextlib import asynccontextmanager
 
@@ -32,34 +33,71 @@ CURRENT_ENV = args.env
 from common.config import cfg
 
 cfg.load_creds(CURRENT_ENV)
-print("INFO:\t  Config was loaded")
+
+from common.logs import get_logger, log_queue
+
+log_queue.start()
+logger = get_logger("main")
+logger.info("Config was loaded")
 cfg.load_secrets()
-print("INFO:\t  Secrets were loaded to config")
+logger.info("Secrets were loaded to config")
 
 
 import uvicorn
 from aiogram import Bot, Dispatcher, types
-from common.utils import exception_handlers, verify_telegram_secret
-from db.utils import _engine, check_db
-from fastapi import BackgroundTasks, Depends, FastAPI
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from common.http import http_pool
+from common.metrics import INGRESS_SECONDS, render, stats_collector
+from common.resolver import dns_resolver
+from common.tracing import tracer
+from common.utils import (
+    exception_handlers,
+    verify_metrics_token,
+    verify_telegram_secret,
+)
+from crud.chats import chat_directory
+from crud.routing import routing_table
+from crud.targets import get_webhooks, routing_cache
+from db.utils import check_db, dispose_engines
+from fastapi import BackgroundTasks, Depends, FastAPI, Request, Response
+from telegram.ingress import build_update, load_update, prefilter
+from telegram.media import download_stats
+from telegram.media_groups import media_groups
 from telegram.middlewares import (
     AuthChannelMiddleware,
     AuthChatMiddleware,
     ForwardChannelMiddleware,
+    MeasuredMiddleware,
+    TracingRequestMiddleware,
 )
+from telegram.outbox import outbox
+from telegram.recorder import recorder
 from telegram.routes.routers import router
-from telegram.utils import COMMANDS
+from telegram.utils import COMMANDS, scheme_resolver
 
-bot = Bot(token=cfg.TELEGRAM_TOKEN)
+if cfg.BOT_API_SERVER:
+    bot = Bot(
+        token=cfg.TELEGRAM_TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(cfg.BOT_API_SERVER)),
+    )
+else:
+    bot = Bot(token=cfg.TELEGRAM_TOKEN)
 dp = Dispatcher()
 
 
 @asynccontextmanager
 async def lifespan_function(FastAPP: FastAPI):
-    print(f"INFO:\t  {args.env} running {args.host}:{args.port}")
-    print()
+    logger.info(f"{args.env} running {args.host}:{args.port}")
 
+    tracer.start()
     await check_db()
+    await http_pool.start()
+    await routing_table.start()
+    await prefilter.start()
+    recorder.start()
+    if cfg.DNS_CACHE and cfg.DNS_PREFETCH:
+        await dns_resolver.prefetch(await get_webhooks())
 
     # webhook_info = await bot.get_webhook_info()
     # if webhook_info.url != f"https://{cfg.DOMAIN}/webhooks/telegram":
@@ -70,9 +108,22 @@ async def lifespan_function(FastAPP: FastAPI):
     )
 
     dp.include_router(router)
-    dp.message.middleware(AuthChatMiddleware())
-    dp.channel_post.middleware(AuthChannelMiddleware())
-    dp.channel_post.middleware(ForwardChannelMiddleware())
+    bot.session.middleware(TracingRequestMiddleware())
+    dp.message.middleware(MeasuredMiddleware(AuthChatMiddleware()))
+    dp.channel_post.middleware(MeasuredMiddleware(AuthChannelMiddleware()))
+    dp.channel_post.middleware(MeasuredMiddleware(ForwardChannelMiddleware()))
+    if routing_table.snapshot is not None:
+        stats_collector.register("routing_table", routing_table.stats)
+    else:
+        stats_collector.register("routing_cache", routing_cache.stats)
+        stats_collector.register("chat_directory", chat_directory.stats)
+    stats_collector.register("scheme_resolver", scheme_resolver.stats)
+    stats_collector.register("dns_resolver", dns_resolver.stats)
+    stats_collector.register("media_groups", media_groups.stats)
+    stats_collector.register("prefilter", prefilter.stats)
+    stats_collector.register("downloads", lambda: download_stats)
+    stats_collector.register("recorder", recorder.stats)
+    outbox.start(bot)
     await bot.set_my_commands(COMMANDS)
     await bot.set_my_description("Webhook Forwarder Telegram Bot")
 
@@ -85,8 +136,16 @@ async def lifespan_function(FastAPP: FastAPI):
 
     yield
 
-    await _engine.dispose()
+    await media_groups.close()
+    await outbox.stop()
+    await prefilter.stop()
+    await routing_table.stop()
+    recorder.stop()
+    await http_pool.close()
+    await dispose_engines()
     await bot.session.close()
+    tracer.stop()
+    log_queue.stop()
 
 
 FastAPP = FastAPI(
@@ -100,16 +159,44 @@ FastAPP = FastAPI(
 )
 
 
-@FastAPP.post("/webhooks/telegram", dependencies=[Depends(verify_telegram_secret)])
-async def webhook_telegram(update: dict, background_tasks: BackgroundTasks):
-    print(update)
-    telegram_update = types.Update(**update)
-    if update.get("channel_post"):
-        background_tasks.add_task(dp.feed_webhook_update, bot, telegram_update)
-    else:
+async def feed_update_in_trace(
+    telegram_update: types.Update, trace: dict[str, str] | None
+) -> None:
+    with tracer.continue_trace("feed_update", trace):
         await dp.feed_webhook_update(bot=bot, update=telegram_update)
 
 
+@FastAPP.post("/webhooks/telegram", dependencies=[Depends(verify_telegram_secret)])
+async def webhook_telegram(request: Request, background_tasks: BackgroundTasks):
+    start = time.perf_counter()
+    update = load_update(await request.body())
+    recorder.record(update)
+    if not prefilter.accepts(update):
+        INGRESS_SECONDS.labels("dropped").observe(time.perf_counter() - start)
+        return
+    with tracer.trace("webhook_telegram", update_id=update.get("update_id")):
+        telegram_update = build_update(update, bot)
+        if update.get("channel_post"):
+            # background task runs after the route, out of its trace context
+            background_tasks.add_task(
+                feed_update_in_trace, telegram_update, tracer.context()
+            )
+        else:
+            await dp.feed_webhook_update(bot=bot, update=telegram_update)
+    INGRESS_SECONDS.labels("accepted").observe(time.perf_counter() - start)
+
+
+async def metrics():
+    content, content_type = render()
+    return Response(content=content, media_type=content_type)
+
+
+if cfg.METRICS_ENABLED:
+    FastAPP.add_api_route(
+        "/metrics", metrics, dependencies=[Depends(verify_metrics_token)]
+    )
+
+
 if __name__ == "__main__":
     log_config = uvicorn.config.LOGGING_CONFIG
     log_config["formatters"]["access"][
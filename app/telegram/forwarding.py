@@ -0,0 +1,76 @@
+import asyncio
+import time
+from typing import Any
+
+import httpx
+from common.config import cfg
+from common.tracing import tracer
+
+from .media import MediaSpool
+
+
+class WebhookFanOut:
+    def __init__(self, max_concurrency: int, max_per_host: int) -> None:
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_per_host = max_per_host
+        self._host_semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def _host_semaphore(self, webhook: str) -> asyncio.Semaphore:
+        host = httpx.URL(webhook).host
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self._max_per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def _deliver(
+        self,
+        client: httpx.AsyncClient,
+        target: dict[str, Any],
+        json: dict[str, str],
+        files: dict[str, tuple[str, MediaSpool, str]],
+    ) -> dict[str, Any]:
+        result = {"target": target, "status_code": None, "error": None, "seconds": None}
+        readers = {}
+        try:
+            with tracer.continue_trace(
+                "delivery", target.get("trace"), target_id=target["id"]
+            ):
+                async with self._semaphore, self._host_semaphore(target["webhook"]):
+                    start = time.perf_counter()
+                    if files:
+                        # multipart body is streamed from spools, not built in memory
+                        for field, (name, spool, mime) in files.items():
+                            readers[field] = (name, spool.open(), mime)
+                        answer = await client.post(
+                            target["webhook"], files=readers, data=json
+                        )
+                    else:
+                        answer = await client.post(target["webhook"], json=json)
+                    result["seconds"] = time.perf_counter() - start
+            result["status_code"] = answer.status_code
+        except Exception as e:
+            result["error"] = e
+        finally:
+            for _, reader, _ in readers.values():
+                reader.close()
+        return result
+
+    async def deliver(
+        self,
+        client: httpx.AsyncClient,
+        deliveries: list[
+            tuple[
+                dict[str, Any], dict[str, str], dict[str, tuple[str, MediaSpool, str]]
+            ]
+        ],
+    ) -> list[dict[str, Any]]:
+        return await asyncio.gather(
+            *[
+                self._deliver(client, target, json, files)
+                for target, json, files in deliveries
+            ]
+        )
+
+
+fan_out = WebhookFanOut(cfg.FORWARD_MAX_CONCURRENCY, cfg.FORWARD_MAX_PER_HOST)
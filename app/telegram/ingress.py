@@ -0,0 +1,114 @@
+import asyncio
+import json
+from importlib.util import find_spec
+from typing import Any
+
+from aiogram import Bot, types
+from common.config import cfg
+from common.logs import bind, get_logger
+from crud import chats as crud_chats
+from crud.routing import routing_table
+
+if find_spec("orjson"):
+    import orjson
+else:
+    orjson = None
+
+logger = get_logger(__name__)
+
+
+def load_update(body: bytes) -> dict[str, Any]:
+    """Decodes raw webhook body once, with orjson when it's installed."""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def build_update(update: dict[str, Any], bot: Bot) -> types.Update:
+    """Validates update already mounted to the bot, otherwise dispatcher dumps
+    and validates it again to propagate the bot to nested objects."""
+    message = (
+        update.get("message")
+        or update.get("channel_post")
+        or update.get("edited_channel_post")
+        or {}
+    )
+    bind(
+        update_id=update.get("update_id"),
+        chat_id=(message.get("chat") or {}).get("id"),
+    )
+    if cfg.DEBUG_DUMP_UPDATES:
+        logger.info("Update", extra={"update": update})
+    else:
+        logger.info("Update received", extra={"event": "update"})
+    return types.Update.model_validate(update, context={"bot": bot})
+
+
+class UpdatePrefilter:
+    """Drops updates that middlewares would ignore anyway, looking only at the
+    raw update: channel posts from unregistered channels and messages from users
+    who aren't owners (except /start). Registered chats are taken from routing
+    snapshot, or kept in memory and reloaded periodically to catch changes made
+    by other processes when there is no snapshot."""
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+        self.active = False
+        self.accepted = 0
+        self.dropped = 0
+
+    async def start(self) -> None:
+        if not cfg.PREFILTER_ENABLED or self.active:
+            return
+        self.active = True
+        if routing_table.snapshot is None:
+            await crud_chats.load_allowlist()
+            self._task = asyncio.create_task(self._refresh())
+
+    async def stop(self) -> None:
+        self.active = False
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _refresh(self) -> None:
+        while True:
+            await asyncio.sleep(cfg.PREFILTER_REFRESH_INTERVAL)
+            try:
+                await crud_chats.load_allowlist()
+            except Exception as e:
+                logger.error(f"Prefilter allowlist reload failed - {type(e)} {e}")
+
+    def accepts(self, update: dict[str, Any]) -> bool:
+        if not self.active:
+            return True
+
+        if self._check(update) is False:
+            self.dropped += 1
+            return False
+        self.accepted += 1
+        return True
+
+    def _check(self, update: dict[str, Any]) -> bool | None:
+        directory = routing_table.snapshot or crud_chats.chat_directory
+        channel_post = update.get("channel_post") or update.get("edited_channel_post")
+        if channel_post:
+            chat_id = (channel_post.get("chat") or {}).get("id")
+            return directory.is_allowed_chat(chat_id)
+
+        message = update.get("message")
+        if message:
+            if (message.get("text") or "").startswith("/start"):
+                return True
+            user_id = (message.get("from") or {}).get("id")
+            return directory.is_allowed_owner(user_id)
+
+        return True
+
+    def stats(self) -> dict[str, int]:
+        return {"accepted": self.accepted, "dropped": self.dropped}
+
+
+prefilter = UpdatePrefilter()
@@ -0,0 +1,140 @@
+import io
+import os
+import tempfile
+from contextlib import suppress
+from typing import Any, BinaryIO
+
+from aiogram import Bot, types
+from common.config import cfg
+from common.logs import get_logger
+
+logger = get_logger(__name__)
+
+
+class MediaTooLargeError(Exception):
+    pass
+
+
+class MediaSpool:
+    """Downloaded file, kept in memory while small and moved to a temp file when
+    it grows over the memory limit. Every reader gets its own file object, so
+    one spool can be uploaded to several targets at once."""
+
+    def __init__(self, memory_limit: int, max_size: int) -> None:
+        self._memory_limit = memory_limit
+        self._max_size = max_size
+        self._buffer: io.BytesIO | None = io.BytesIO()
+        self._data: bytes | None = None
+        self._file: BinaryIO | None = None
+        self.size = 0
+
+    @property
+    def on_disk(self) -> bool:
+        return self._file is not None
+
+    def write(self, chunk: bytes) -> int:
+        self.size += len(chunk)
+        if self.size > self._max_size:
+            raise MediaTooLargeError(f"File is bigger than {self._max_size} bytes")
+
+        if self._file is None and self.size > self._memory_limit:
+            self._file = tempfile.NamedTemporaryFile(
+                prefix="wftb-", dir=cfg.MEDIA_SPOOL_DIR, delete=False
+            )
+            self._file.write(self._buffer.getvalue())
+            self._buffer = None
+
+        if self._file is not None:
+            return self._file.write(chunk)
+        return self._buffer.write(chunk)
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        # aiogram seeks destination after downloading, readers are opened separately
+        return 0
+
+    def finish(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        else:
+            self._data = self._buffer.getvalue()
+            self._buffer = None
+
+    def open(self) -> BinaryIO:
+        if self._file is not None:
+            return open(self._file.name, "rb")
+        # BytesIO shares the bytes object until something writes to it
+        return io.BytesIO(self._data)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            with suppress(FileNotFoundError):
+                os.unlink(self._file.name)
+            self._file = None
+        self._buffer = None
+        self._data = None
+
+
+download_stats = {"groups": 0, "files": 0, "seconds": 0.0, "last_seconds": 0.0}
+
+
+def record_download(group_id: str, files: int, seconds: float) -> None:
+    download_stats["groups"] += 1
+    download_stats["files"] += files
+    download_stats["seconds"] += seconds
+    download_stats["last_seconds"] = seconds
+    logger.info(
+        f"Group {group_id} - {files} files downloaded in {seconds:.3f}s",
+        extra={"event": "downloaded"},
+    )
+
+
+async def download_to_spool(bot: Bot, file_id: str) -> MediaSpool:
+    spool = MediaSpool(cfg.MEDIA_MEMORY_LIMIT, cfg.MEDIA_MAX_FILE_SIZE)
+    try:
+        await bot.download(file_id, destination=spool, seek=False)
+        spool.finish()
+    except Exception:
+        spool.close()
+        raise
+    return spool
+
+
+def get_message_file(message: types.Message, counter: int) -> dict[str, Any] | None:
+    if message.photo:
+        orig_photo = types.PhotoSize(
+            file_id="0", file_unique_id="0", width=0, height=0, file_size=0
+        )
+        for photo in message.photo:
+            if photo.file_size > orig_photo.file_size:
+                orig_photo = photo
+        media, name, mime = orig_photo, f"file{counter}.jpg", "image/jpeg"
+    elif message.video:
+        media = message.video
+        name = media.file_name or f"file{counter}.mp4"
+        mime = media.mime_type or "video/mp4"
+    elif message.animation:
+        media = message.animation
+        name = media.file_name or f"file{counter}.mp4"
+        mime = media.mime_type or "video/mp4"
+    elif message.document:
+        media = message.document
+        name = media.file_name or f"file{counter}"
+        mime = media.mime_type or "application/octet-stream"
+    else:
+        return None
+
+    if media.file_size and media.file_size > cfg.MEDIA_MAX_FILE_SIZE:
+        logger.warning(f"File {name} is too large to forward - {media.file_size} bytes")
+        return None
+
+    return {
+        "file_id": media.file_id,
+        "field": f"file{counter}",
+        "name": name,
+        "mime": mime,
+    }
@@ -0,0 +1,236 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import Bot, types
+from cachetools import TTLCache
+from common.config import cfg
+from common.logs import get_logger
+from common.metrics import MEDIA_GROUP_WAIT_SECONDS
+from common.tracing import tracer
+from crud import media_groups as crud_media_groups
+
+logger = get_logger(__name__)
+
+Handler = Callable[[types.Message, Dict[str, Any]], Awaitable[Any]]
+
+
+class MemoryMediaGroupStore:
+    """Media group parts kept in this process, enough for a single worker."""
+
+    def __init__(self) -> None:
+        self._groups: dict[str, dict[str, Any]] = {}
+        # claimed groups, kept as long as the database store keeps them
+        self._claimed = TTLCache(
+            maxsize=10000, ttl=max(60, 10 * cfg.MEDIA_GROUP_MAX_WAIT)
+        )
+
+    async def add(self, media_group_id: str, part: dict[str, Any]) -> bool:
+        if media_group_id in self._claimed:
+            return False
+        now = time.monotonic()
+        group = self._groups.setdefault(
+            media_group_id, {"parts": [], "first_seen": now}
+        )
+        group["parts"].append(part)
+        group["last_seen"] = now
+        return True
+
+    async def claim(
+        self, media_group_id: str, quiet_window: float, max_wait: float, bot: Bot
+    ) -> list[dict[str, Any]] | float | None:
+        group = self._groups.get(media_group_id)
+        if group is None:
+            return None
+
+        now = time.monotonic()
+        flush_at = min(
+            group["last_seen"] + quiet_window, group["first_seen"] + max_wait
+        )
+        if flush_at > now:
+            return flush_at - now
+
+        del self._groups[media_group_id]
+        self._claimed[media_group_id] = True
+        return sorted(group["parts"], key=lambda part: part["event"].message_id)
+
+
+class DatabaseMediaGroupStore:
+    """Media group parts kept in the database, so parts of one album received by
+    different worker processes are forwarded together, and only once."""
+
+    def __init__(self) -> None:
+        self._last_cleanup = time.monotonic()
+
+    async def add(self, media_group_id: str, part: dict[str, Any]) -> bool:
+        payload = dict(part)
+        payload["event"] = part["event"].model_dump(mode="json", exclude_none=True)
+        return await crud_media_groups.add_media_group_part(
+            media_group_id, part["event"].message_id, payload
+        )
+
+    async def claim(
+        self, media_group_id: str, quiet_window: float, max_wait: float, bot: Bot
+    ) -> list[dict[str, Any]] | float | None:
+        if time.monotonic() - self._last_cleanup > 60:
+            self._last_cleanup = time.monotonic()
+            await crud_media_groups.remove_stale_media_groups(max(60, 10 * max_wait))
+
+        parts = await crud_media_groups.claim_media_group(
+            media_group_id, quiet_window, max_wait
+        )
+        if not isinstance(parts, list):
+            return parts
+
+        for part in parts:
+            part["event"] = types.Message.model_validate(part["event"]).as_(bot)
+        return parts
+
+
+class MediaGroupAggregator:
+    """Collects media group parts and passes the group to the handler once no new
+    part came for the quiet window, or the max wait is over. Each group has one
+    timer per process, which is moved forward by every new part; the store
+    decides which process gets to forward the group."""
+
+    def __init__(
+        self,
+        store: MemoryMediaGroupStore | DatabaseMediaGroupStore,
+        quiet_window: float,
+        max_wait: float,
+    ) -> None:
+        self.store = store
+        self.quiet_window = quiet_window
+        self.max_wait = max_wait
+        self._groups: dict[str, dict[str, Any]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    async def add(
+        self, event: types.Message, data: Dict[str, Any], handler: Handler
+    ) -> None:
+        media_group_id = f"{event.chat.id}:{event.media_group_id}"
+        added = await self.store.add(
+            media_group_id,
+            {
+                "event": event,
+                "message_text_original": data["message_text_original"],
+                "message_text_edited": data["message_text_edited"],
+                "matched_keys": sorted(data["matched_keys"]),
+            },
+        )
+        if not added:
+            logger.warning(
+                f"Media group part came after the group was forwarded, dropped"
+                f" - {media_group_id} {event.message_id}"
+            )
+            return
+
+        loop = asyncio.get_running_loop()
+        group = self._groups.get(media_group_id)
+        if group is None:
+            group = {
+                "timer": None,
+                "started": loop.time(),
+                "wait_span": tracer.start_span("media_group_wait"),
+                "deadline": loop.time() + self.max_wait,
+            }
+            self._groups[media_group_id] = group
+        else:
+            group["timer"].cancel()
+        group["data"] = data
+        group["handler"] = handler
+        self._schedule(
+            media_group_id, min(self.quiet_window, group["deadline"] - loop.time())
+        )
+
+    def _schedule(self, media_group_id: str, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        self._groups[media_group_id]["timer"] = loop.call_later(
+            delay, self._spawn_flush, media_group_id
+        )
+
+    def _spawn_flush(self, media_group_id: str, force: bool = False) -> None:
+        task = asyncio.create_task(self._flush(media_group_id, force))
+        self._tasks.add(task)
+        task.add_done_callback(self._handled)
+
+    def _handled(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            e = task.exception()
+            logger.error(f"Media group wasn't handled - {type(e)} {e}", exc_info=e)
+
+    async def _flush(self, media_group_id: str, force: bool = False) -> None:
+        # popped before awaiting, so a part arriving meanwhile starts a new timer
+        group = self._groups.pop(media_group_id, None)
+        if group is None:
+            return
+        group["timer"].cancel()
+
+        data = group["data"]
+        # the wait ends with the group claimed, taken by another process or an
+        # error, it goes on while the group is rescheduled
+        outcome = "error"
+        error = None
+        try:
+            parts = await self.store.claim(
+                media_group_id,
+                0 if force else self.quiet_window,
+                0 if force else self.max_wait,
+                data["bot"],
+            )
+            if parts is None:
+                outcome = "taken"
+                return
+            if not isinstance(parts, list):
+                # other processes still receive parts, check again later
+                if media_group_id not in self._groups:
+                    self._groups[media_group_id] = group
+                    self._schedule(media_group_id, parts)
+                    outcome = None
+                else:
+                    # a part arrived meanwhile and started a new wait
+                    outcome = "superseded"
+                return
+            outcome = "claimed"
+            MEDIA_GROUP_WAIT_SECONDS.observe(
+                asyncio.get_running_loop().time() - group["started"]
+            )
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            span = group["wait_span"]
+            if outcome is not None and span is not None:
+                span["attributes"]["claim"] = outcome
+                tracer.end_span(span, error)
+
+        data = dict(data)
+        data["message_text_original"] = parts[0]["message_text_original"]
+        data["message_text_edited"] = parts[0]["message_text_edited"]
+        data["matched_keys"] = set(parts[0]["matched_keys"])
+        data["messages_group"] = [part["event"] for part in parts]
+        await group["handler"](parts[0]["event"], data)
+
+    def stats(self) -> dict[str, int]:
+        return {"groups": len(self._groups), "flushing": len(self._tasks)}
+
+    async def close(self) -> None:
+        for media_group_id in list(self._groups):
+            self._spawn_flush(media_group_id, force=True)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def get_media_group_store() -> MemoryMediaGroupStore | DatabaseMediaGroupStore:
+    if cfg.MEDIA_GROUP_STORE == "database":
+        return DatabaseMediaGroupStore()
+    return MemoryMediaGroupStore()
+
+
+media_groups = MediaGroupAggregator(
+    get_media_group_store(), cfg.MEDIA_GROUP_QUIET_WINDOW, cfg.MEDIA_GROUP_MAX_WAIT
+)
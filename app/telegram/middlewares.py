@@ -1,15 +1,75 @@
 import asyncio
+import time
 from contextlib import suppress
 from typing import Any, Awaitable, Callable, Dict
 
-from aiogram import BaseMiddleware, types
+from aiogram import BaseMiddleware, Bot, types
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
-from cachetools import TTLCache
+from aiogram.methods import Response, TelegramMethod
 from common.config import cfg
+from common.metrics import MIDDLEWARE_SECONDS, PROBE_SECONDS
+from common.tracing import tracer
 from crud.chats import chat_exists, owner_exists
-from crud.targets import get_targets
+from crud.targets import get_routing
 
-from .utils import check_connection
+from .media_groups import media_groups
+from .utils import (
+    get_entity_ranges,
+    get_link_preview,
+    get_link_replacements,
+    rewrite_text,
+    scheme_resolver,
+)
+
+
+class MeasuredMiddleware(BaseMiddleware):
+    """Observes time spent in the wrapped middleware itself, handlers called by
+    it are subtracted."""
+
+    def __init__(self, middleware: BaseMiddleware) -> None:
+        self.middleware = middleware
+        self.name = type(middleware).__name__
+        self.histogram = MIDDLEWARE_SECONDS.labels(self.name)
+
+    async def __call__(
+        self,
+        handler: Callable[[types.Message, Dict[str, Any]], Awaitable[Any]],
+        event: types.Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_seconds = 0.0
+
+        async def measured_handler(event: types.Message, data: Dict[str, Any]) -> Any:
+            nonlocal handler_seconds
+            start = time.perf_counter()
+            try:
+                return await handler(event, data)
+            finally:
+                handler_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            with tracer.span(self.name):
+                return await self.middleware(measured_handler, event, data)
+        finally:
+            self.histogram.observe(time.perf_counter() - start - handler_seconds)
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Span per Bot API request (edits, getFile and so on)."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        with tracer.span(f"bot {type(method).__name__}"):
+            return await make_request(bot, method)
 
 
 class AuthChatMiddleware(BaseMiddleware):
@@ -50,12 +110,6 @@ class AuthChannelMiddleware(BaseMiddleware):
 
 
 class ForwardChannelMiddleware(BaseMiddleware):
-    def __init__(self):
-        super().__init__()
-        self.delay = 15
-        self.media_group_cache = TTLCache(ttl=40.0, maxsize=1000.0)
-        self.lock = asyncio.Lock()
-
     async def __call__(
         self,
         handler: Callable[[types.Message, Dict[str, Any]], Awaitable[Any]],
@@ -67,110 +121,66 @@ class ForwardChannelMiddleware(BaseMiddleware):
             message_text = event.caption or ""
         message_text = message_text.rstrip()
 
-        chat_targets = await get_targets(event.chat.id)
-        keys_to_remove = [target["key"] for target in chat_targets if target["key"]]
+        chat_routing = await get_routing(event.chat.id)
+        message_entities = event.entities or event.caption_entities or []
+        if (
+            not chat_routing["keys"]
+            and not any(entity.type == "url" for entity in message_entities)
+            and not message_text[:1].isspace()
+        ):
+            # no keys to remove and no links to rewrite, the post is forwarded
+            # as it is; always_link_preview only picks among links
+            return await self._forward(
+                event, data, handler, message_text, message_text, set()
+            )
+
+        chat_targets = chat_routing["targets"]
+        key_matcher = chat_routing["matcher"]
+        key_occurrences = key_matcher.find(message_text)
+        matched_keys = {key for _, _, key in key_occurrences}
         always_link_preview = any(
             [
                 target["always_link_preview"]
                 for target in chat_targets
-                if not target["key"] or target["key"] in message_text
+                if not target["key"] or target["key"] in matched_keys
             ]
         )
 
-        message_text_edited = str(message_text)
-
-        message_entities = event.entities or event.caption_entities or []
         message_entities = sorted(
             [entity for entity in message_entities if entity.type == "url"],
             key=lambda entity: entity.offset,
         )
-        # python get messages in utf-8, but telegram calculates offsets in utf-16, so
-        # if message contains emojis, offsets will be shifted relative to utf-8
-        fixed_message_entities = []
-        message_text_utf_16 = message_text.encode("utf-16-le")
-        for entity in message_entities:
-            prefix_utf_16 = message_text_utf_16[: (entity.offset * 2)].decode(
-                "utf-16-le"
-            )
-            entity.offset = len(prefix_utf_16)
-            fixed_message_entities.append(entity)
+        link_ranges = get_entity_ranges(message_text, message_entities)
 
-        connections_storage = {}
-        tasks_list = []
-        for entity in fixed_message_entities:
-            link = message_text[entity.offset : (entity.offset + entity.length)]
+        links_to_resolve = {}
+        for start, end in link_ranges:
+            link = message_text[start:end]
             if not link.startswith(("http://", "https://")):
-                tasks_list.append(
-                    asyncio.create_task(
-                        check_connection(
-                            link, "https", connections_storage, entity.offset
-                        )
-                    )
-                )
-                tasks_list.append(
-                    asyncio.create_task(
-                        check_connection(
-                            link, "http", connections_storage, entity.offset
-                        )
-                    )
+                links_to_resolve[start] = link
+        link_schemes = {}
+        if links_to_resolve:
+            with PROBE_SECONDS.time(), tracer.span("scheme_probe"):
+                schemes = await asyncio.gather(
+                    *[
+                        scheme_resolver.resolve(link)
+                        for link in links_to_resolve.values()
+                    ]
                 )
-        if tasks_list:
-            await asyncio.gather(*tasks_list)
-
-        message_text_edited_fixed_links = ""
-        iterator = 0
-
-        link_preview = None
-        forced_link_preview = None
-        if getattr(event.link_preview_options, "url", None):
-            link_preview = event.link_preview_options.url
-        elif (
-            always_link_preview
-            or not hasattr(event.link_preview_options, "is_disabled")
-            or event.link_preview_options.is_disabled != True
-            and "link_preview_is_disabled"
-            not in str(event.link_preview_options.is_disabled)
-        ):
-            if fixed_message_entities:
-                entity = fixed_message_entities[0]
-                link_preview = message_text[
-                    entity.offset : (entity.offset + entity.length)
-                ]
-
-        for entity in fixed_message_entities:
-            message_text_edited_fixed_links += message_text[iterator : entity.offset]
-            link = message_text[entity.offset : (entity.offset + entity.length)]
-            link_original = (
-                message_text[entity.offset : (entity.offset + entity.length)]
-                .removeprefix("http://")
-                .removeprefix("https://")
-                .removeprefix("www.")
-            )
-            if not link.startswith(("http://", "https://")):
-                if connections_storage.get(("https", entity.offset)):
-                    link = f"https://{link}"
-                elif connections_storage.get(("http", entity.offset)):
-                    link = f"http://{link}"
-            if link.startswith(("http://", "https://")):
-                if link_preview and link_original in link_preview:
-                    forced_link_preview = str(link)
-                else:
-                    link = f"<{link}>"
-
-            message_text_edited_fixed_links += link
-            iterator = entity.offset + entity.length
-        message_text_edited_fixed_links += message_text[iterator:]
-
-        for key in keys_to_remove:
-            message_text_edited = message_text_edited.replace(key, "")
-            message_text_edited_fixed_links = message_text_edited_fixed_links.replace(
-                key, ""
-            )
-        message_text_edited = message_text_edited.lstrip().rstrip()
-        message_text_edited_fixed_links = (
-            message_text_edited_fixed_links.lstrip().rstrip()
+            link_schemes = dict(zip(links_to_resolve, schemes))
+
+        link_preview = get_link_preview(
+            message_text, link_ranges, event.link_preview_options, always_link_preview
+        )
+        links, forced_link_preview = get_link_replacements(
+            message_text, link_ranges, link_schemes, link_preview
         )
 
+        message_text_edited, message_text_edited_fixed_links = rewrite_text(
+            message_text, links, key_matcher, key_occurrences
+        )
+        message_text_edited = message_text_edited.strip()
+        message_text_edited_fixed_links = message_text_edited_fixed_links.strip()
+
         # check if message doesn't have 'payload' (no pics and all text is keys)
         if event.text and message_text_edited == "":
             return
@@ -212,31 +222,29 @@ class ForwardChannelMiddleware(BaseMiddleware):
                         caption_entities=event.caption_entities,
                     )
 
+        return await self._forward(
+            event,
+            data,
+            handler,
+            message_text,
+            message_text_edited_fixed_links,
+            matched_keys,
+        )
+
+    async def _forward(
+        self,
+        event: types.Message,
+        data: Dict[str, Any],
+        handler: Callable[[types.Message, Dict[str, Any]], Awaitable[Any]],
+        message_text: str,
+        message_text_edited: str,
+        matched_keys: set[str],
+    ) -> Any:
         data["message_text_original"] = message_text
-        data["message_text_edited"] = message_text_edited_fixed_links
+        data["message_text_edited"] = message_text_edited
+        data["matched_keys"] = matched_keys
         if event.media_group_id == None:
             data["messages_group"] = [event]
             return await handler(event, data)
 
-        media_group_id = event.media_group_id
-        message_id = event.message_id
-
-        async with self.lock:
-            self.media_group_cache.setdefault(media_group_id, list())
-            self.media_group_cache[media_group_id].append(event)
-
-        await asyncio.sleep(self.delay)
-
-        message_id = event.message_id
-        message_id_first = event.message_id
-
-        message: types.Message
-        for message in self.media_group_cache.get(media_group_id, []):
-            if message.message_id < message_id_first:
-                message_id_first = message.message_id
-
-        if message_id != message_id_first:
-            return
-
-        data["messages_group"] = self.media_group_cache.get(media_group_id, [])
-        return await handler(event, data)
+        await media_groups.add(event, data, handler)
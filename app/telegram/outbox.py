@@ -0,0 +1,230 @@
+import asyncio
+import random
+import time
+from contextlib import suppress
+from typing import Any
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from common.config import cfg
+from common.http import http_pool
+from common.logs import get_logger
+from common.metrics import DELIVERIES, DELIVERY_SECONDS
+from common.tracing import tracer
+from crud import chats as crud_chats
+from crud import deliveries as crud_deliveries
+
+from .forwarding import fan_out
+from .media import MediaSpool, download_to_spool, record_download
+
+logger = get_logger(__name__)
+
+
+def is_retryable(status_code: int | None) -> bool:
+    # network errors, timeouts, rate limits and server errors can go away,
+    # other client errors won't
+    if status_code is None:
+        return True
+    return status_code in (408, 425, 429) or status_code >= 500
+
+
+class Outbox:
+    def __init__(self) -> None:
+        self._bot: Bot | None = None
+        self._wakeup = asyncio.Event()
+        self._workers: list[asyncio.Task] = []
+        self._download_semaphore = asyncio.Semaphore(cfg.MEDIA_DOWNLOAD_CONCURRENCY)
+
+    def wakeup(self) -> None:
+        self._wakeup.set()
+
+    def start(self, bot: Bot) -> None:
+        self._bot = bot
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(cfg.OUTBOX_WORKERS)
+        ]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(
+            cfg.OUTBOX_BACKOFF_MAX, cfg.OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1)
+        )
+        # half of the delay is fixed, half is jitter, so receivers that come back
+        # up aren't hit by every retry at once
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _worker(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                deliveries = await crud_deliveries.claim_deliveries(
+                    cfg.OUTBOX_BATCH_SIZE, cfg.OUTBOX_LEASE
+                )
+                if deliveries:
+                    await self._process(deliveries)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox worker failed - {type(e)} {e}", exc_info=e)
+
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), cfg.OUTBOX_POLL_INTERVAL)
+
+    async def _download_file(
+        self, file_id: str, trace: dict[str, str] | None
+    ) -> tuple[MediaSpool | None, float, float]:
+        async with self._download_semaphore:
+            # started once it's not queued behind other files
+            started = time.perf_counter()
+            try:
+                with tracer.continue_trace("download", trace):
+                    spool = await download_to_spool(self._bot, file_id)
+            except Exception as e:
+                logger.error(f"File download failed - {type(e)} {e}")
+                spool = None
+        return spool, started, time.perf_counter()
+
+    async def _download_files(
+        self, deliveries: list[dict[str, Any]]
+    ) -> dict[str, MediaSpool | None]:
+        file_traces = {}
+        groups = {}
+        for delivery in deliveries:
+            files = delivery["payload"].get("files", [])
+            for file in files:
+                # a file shared by several deliveries is traced in the first one
+                file_traces.setdefault(
+                    file["file_id"], delivery["payload"].get("trace")
+                )
+            # retries download the group again, it's recorded once
+            if files and delivery["attempts"] == 1:
+                group_id = delivery["payload"].get("media_group_id")
+                groups[group_id or files[0]["file_id"]] = [
+                    file["file_id"] for file in files
+                ]
+
+        downloaded = dict(
+            zip(
+                file_traces,
+                await asyncio.gather(
+                    *[
+                        self._download_file(file_id, trace)
+                        for file_id, trace in file_traces.items()
+                    ]
+                ),
+            )
+        )
+        for group_id, group_file_ids in groups.items():
+            # from the first of the group's own downloads to its last one
+            started = min(downloaded[file_id][1] for file_id in group_file_ids)
+            finished = max(downloaded[file_id][2] for file_id in group_file_ids)
+            record_download(group_id, len(group_file_ids), finished - started)
+
+        return {file_id: spool for file_id, (spool, _, _) in downloaded.items()}
+
+    async def _process(self, deliveries: list[dict[str, Any]]) -> None:
+        downloaded = await self._download_files(deliveries)
+        try:
+            await self._send(deliveries, downloaded)
+        finally:
+            for spool in downloaded.values():
+                if spool is not None:
+                    spool.close()
+
+    async def _send(
+        self,
+        deliveries: list[dict[str, Any]],
+        downloaded: dict[str, MediaSpool | None],
+    ) -> None:
+        to_send = []
+        sending = []
+        not_downloaded = []
+        for delivery in deliveries:
+            files = {}
+            for file in delivery["payload"].get("files", []):
+                spool = downloaded[file["file_id"]]
+                if spool is None:
+                    not_downloaded.append(delivery)
+                    break
+                files[file["field"]] = (file["name"], spool, file["mime"])
+            else:
+                target = {
+                    "id": delivery["target_id"],
+                    "webhook": delivery["webhook"],
+                    "trace": delivery["payload"].get("trace"),
+                }
+                json = {"content": delivery["payload"]["content"]}
+                to_send.append((target, json, files))
+                sending.append(delivery)
+
+        results = await fan_out.deliver(http_pool.client, to_send)
+
+        delivered = []
+        for delivery, result in zip(sending, results):
+            status_code = result["status_code"]
+            target_id = str(delivery["target_id"])
+            if result["seconds"] is not None:
+                DELIVERY_SECONDS.labels(target_id).observe(result["seconds"])
+            DELIVERIES.labels(target_id, str(status_code or "error")).inc()
+            log_fields = {
+                "chat_id": delivery["chat_id"],
+                "target_id": delivery["target_id"],
+                "status_code": status_code,
+                "attempts": delivery["attempts"],
+            }
+            if result["error"] is None and 200 <= status_code <= 299:
+                delivered.append(delivery["id"])
+                logger.info("Delivered", extra={"event": "delivered", **log_fields})
+                continue
+
+            if result["error"] is not None:
+                error = result["error"]
+                logger.warning(
+                    f"Delivery failed - {type(error)} {error}", extra=log_fields
+                )
+            else:
+                logger.warning(f"Delivery failed - {status_code}", extra=log_fields)
+            await self._failed(delivery, status_code)
+
+        for delivery in not_downloaded:
+            await self._failed(delivery, None)
+
+        await crud_deliveries.remove_deliveries(delivered)
+
+    async def _failed(self, delivery: dict[str, Any], status_code: int | None) -> None:
+        if is_retryable(status_code) and delivery["attempts"] < cfg.OUTBOX_MAX_ATTEMPTS:
+            await crud_deliveries.reschedule_delivery(
+                delivery["id"], self.backoff(delivery["attempts"])
+            )
+            # the owner learns of a failure right away, not after every retry
+            if delivery["attempts"] == 1:
+                await self._notify_owner(delivery, status_code, retrying=True)
+            return
+
+        await crud_deliveries.remove_deliveries([delivery["id"]])
+        await self._notify_owner(delivery, status_code, retrying=False)
+
+    async def _notify_owner(
+        self, delivery: dict[str, Any], status_code: int | None, retrying: bool
+    ) -> None:
+        owner_id = await crud_chats.get_owner(delivery["chat_id"])
+        if not owner_id:
+            return
+        message_text = "Channel message wasn't forwarded"
+        if status_code is not None:
+            message_text += f" - {status_code}"
+        if retrying:
+            message_text += ", retrying"
+        elif delivery["attempts"] > 1:
+            message_text += f", gave up after {delivery['attempts']} attempts"
+        with suppress(TelegramBadRequest, TelegramForbiddenError):
+            await self._bot.send_message(chat_id=owner_id, text=message_text)
+
+
+outbox = Outbox()
@@ -0,0 +1,158 @@
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from queue import Full, Queue
+from typing import Any
+
+from common.config import cfg
+from common.logs import get_logger
+
+logger = get_logger(__name__)
+
+ASTRAL_OR_SPACE = re.compile("[\\s\\U00010000-\\U0010ffff]")
+# entities that are kept by redaction, keys are usually hashtags
+KEPT_ENTITIES = ("url", "hashtag", "cashtag")
+NAME_FIELDS = ("username", "first_name", "last_name", "title")
+
+
+def redact_text(text: str, entities: list[dict[str, Any]]) -> str:
+    """Replaces chars with 'x', except spaces, emojis and kept entities. Length
+    in utf-16 units is the same, so entity offsets stay valid."""
+    kept = []
+    position = 0
+    units = 0
+    for entity in sorted(entities, key=lambda entity: entity["offset"]):
+        if entity.get("type") not in KEPT_ENTITIES:
+            continue
+        # utf-16 offsets to indices, entities are sorted
+        while position < len(text) and units < entity["offset"]:
+            units += 2 if ord(text[position]) > 0xFFFF else 1
+            position += 1
+        start = position
+        while position < len(text) and units < entity["offset"] + entity["length"]:
+            units += 2 if ord(text[position]) > 0xFFFF else 1
+            position += 1
+        kept.append((start, position))
+
+    parts = []
+    position = 0
+    for start, end in kept + [(len(text), len(text))]:
+        parts.append(
+            "".join(
+                char if ASTRAL_OR_SPACE.match(char) else "x"
+                for char in text[position:start]
+            )
+        )
+        parts.append(text[start:end])
+        position = end
+    return "".join(parts)
+
+
+def redact(value: Any) -> Any:
+    """Copy of update without texts and names, structure and ids are kept."""
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    redacted = {}
+    for key, item in value.items():
+        if key in ("text", "caption") and isinstance(item, str):
+            entities = value.get("entities") or value.get("caption_entities") or []
+            redacted[key] = redact_text(item, entities)
+        elif key in NAME_FIELDS and isinstance(item, str):
+            redacted[key] = "x" * len(item)
+        else:
+            redacted[key] = redact(item)
+    return redacted
+
+
+class UpdateRecorder:
+    """Appends incoming updates with arrival time to gzipped JSON lines
+    segments, rotated by size and age. Serialization, redaction and writing
+    are done by a background thread. Updates coming faster than they are
+    written are dropped, not kept in memory."""
+
+    def __init__(self) -> None:
+        self._queue = Queue(maxsize=cfg.RECORDER_QUEUE_SIZE)
+        self._thread: threading.Thread | None = None
+        self.recorded = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        if not cfg.RECORDER_ENABLED or self._thread is not None:
+            return
+        os.makedirs(cfg.RECORDER_DIR, exist_ok=True)
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        # a full queue of a dead writer would block forever
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+        if self.dropped:
+            logger.warning(f"Recorder dropped {self.dropped} updates")
+
+    def record(self, update: dict[str, Any]) -> None:
+        if self._thread is None:
+            return
+        try:
+            self._queue.put_nowait((time.time(), update))
+        except Full:
+            self.dropped += 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+        }
+
+    def _open_segment(self, number: int) -> gzip.GzipFile:
+        name = time.strftime("updates-%Y%m%d-%H%M%S", time.gmtime())
+        path = os.path.join(cfg.RECORDER_DIR, f"{name}-{number:04}.jsonl.gz")
+        return gzip.open(path, "wt", encoding="utf-8")
+
+    def _write(self) -> None:
+        number = 0
+        segment = None
+        opened = 0.0
+        written = 0
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            arrived, update = item
+            try:
+                if cfg.RECORDER_REDACT:
+                    update = redact(update)
+                line = json.dumps({"t": arrived, "update": update}, ensure_ascii=False)
+
+                if segment is not None and (
+                    written >= cfg.RECORDER_SEGMENT_SIZE
+                    or arrived - opened >= cfg.RECORDER_SEGMENT_SECONDS
+                ):
+                    segment.close()
+                    segment = None
+                if segment is None:
+                    number += 1
+                    segment = self._open_segment(number)
+                    opened = arrived
+                    written = 0
+                segment.write(line + "\n")
+                written += len(line) + 1
+                self.recorded += 1
+            except Exception as e:
+                logger.error(f"Update wasn't recorded - {type(e)} {e}")
+        if segment is not None:
+            segment.close()
+
+
+recorder = UpdateRecorder()
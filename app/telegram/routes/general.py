@@ -1,16 +1,20 @@
-import time
 from contextlib import suppress
 
-import httpx
 from aiogram import Bot, F, Router, types
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import IS_ADMIN, IS_NOT_MEMBER, ChatMemberUpdatedFilter, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.utils import formatting
 from common.config import cfg
+from common.logs import get_logger
+from common.metrics import HANDLER_SECONDS
+from common.tracing import tracer
 from crud import chats as crud_chats
+from crud import deliveries as crud_deliveries
 from crud import targets as crud_targets
 
+from ..media import get_message_file
+from ..outbox import outbox
 from ..utils import (
     CallbackAbort,
     CallbackChooseChat,
@@ -21,6 +25,8 @@ from ..utils import (
     get_keyboard_targets,
 )
 
+logger = get_logger(__name__)
+
 router = Router()
 
 
@@ -29,8 +35,9 @@ async def start_handler(message: types.Message):
     chat_id = message.chat.id
     owner_id = message.from_user.id
 
-    print(
-        f"Start: {owner_id=} {message.from_user.username=} {chat_id=} {time.asctime()}"
+    logger.info(
+        f"Start: {owner_id=} {message.from_user.username=} {chat_id=}",
+        extra={"chat_id": chat_id, "owner_id": owner_id},
     )
 
     chat_added = await crud_chats.add_chat(chat_id, owner_id)
@@ -56,8 +63,9 @@ async def start_channel_handler(event: types.ChatMemberUpdated, bot: Bot):
     if not (await crud_chats.owner_exists(owner_id)):
         return
 
-    print(
-        f"Start: {owner_id=} {event.from_user.username=} {chat_id=} {event.chat.title=} {time.asctime()}"
+    logger.info(
+        f"Start: {owner_id=} {event.from_user.username=} {chat_id=} {event.chat.title=}",
+        extra={"chat_id": chat_id, "owner_id": owner_id},
     )
 
     chat_added = await crud_chats.add_chat(chat_id, owner_id)
@@ -72,7 +80,10 @@ async def stop_handler(message: types.Message, bot: Bot):
     chat_id = message.chat.id
     owner_id = message.from_user.id
 
-    print(f"Stop: {owner_id=} {message.from_user.username=} {time.asctime()}")
+    logger.info(
+        f"Stop: {owner_id=} {message.from_user.username=}",
+        extra={"owner_id": owner_id},
+    )
 
     owned_chats = await crud_chats.get_owned_chats(owner_id)
     if not owned_chats:
@@ -111,7 +122,10 @@ async def stop_channel_handler(event: types.ChatMemberUpdated, bot: Bot):
     if not (await crud_chats.check_ownership(chat_id, from_id)):
         return
 
-    print(f"Stop: {from_id=} {from_name=} {chat_id=} {chat_title=} {time.asctime()}")
+    logger.info(
+        f"Stop: {from_id=} {from_name=} {chat_id=} {chat_title=}",
+        extra={"chat_id": chat_id, "owner_id": from_id},
+    )
 
     await crud_chats.remove_chats([chat_id])
     message_text = f"Notification\nBot leaved from channel '{chat_title}'"
@@ -318,60 +332,62 @@ async def channel_post_handler(
     bot: Bot,
     message_text_original: str,
     message_text_edited: str,
+    matched_keys: set[str],
     messages_group,
 ):
-    owner_id = await crud_chats.get_owner(channel_post.chat.id)
-    pictures = {}
-    counter = 1
+    with HANDLER_SECONDS.labels("channel_post_handler").time(), tracer.span(
+        "channel_post_handler"
+    ):
+        await forward_channel_post(
+            channel_post,
+            message_text_original,
+            message_text_edited,
+            matched_keys,
+            messages_group,
+        )
+
+
+async def forward_channel_post(
+    channel_post: types.Message,
+    message_text_original: str,
+    message_text_edited: str,
+    matched_keys: set[str],
+    messages_group,
+) -> None:
+    files = []
     message: types.Message
     for message in sorted(messages_group, key=lambda msg: msg.message_id):
-        if message.photo:
-            orig_photo = types.PhotoSize(
-                file_id="0", file_unique_id="0", width=0, height=0, file_size=0
-            )
-            for photo in message.photo:
-                if photo.file_size > orig_photo.file_size:
-                    orig_photo = photo
-
-            orig_photo_bytes = await bot.download(orig_photo)
-            pictures[f"file{counter}"] = (
-                f"file{counter}.jpg",
-                orig_photo_bytes,
-                "image/jpeg",
-            )
-            counter += 1
+        file = get_message_file(message, len(files) + 1)
+        if file:
+            files.append(file)
 
-    if not message_text_original and not pictures:
+    if not message_text_original and not files:
         return
 
-    async with httpx.AsyncClient() as ac:
-        chat_targets = await crud_targets.get_targets(channel_post.chat.id)
-        for target in chat_targets:
-            webhook = target["webhook"]
-            key = target["key"]
-            prefix = target["prefix"]
-
-            message_text_to_send = str(message_text_edited)
-            if prefix:
-                message_text_to_send = f"{prefix}\n{message_text_to_send}"
-            json = {"content": message_text_to_send}
-
-            if not key or key in message_text_original:
-                try:
-                    if pictures:
-                        answer = await ac.post(webhook, files=pictures, data=json)
-                    else:
-                        answer = await ac.post(webhook, json=json)
-                    if answer.status_code < 200 or answer.status_code > 299:
-                        if owner_id:
-                            await bot.send_message(
-                                chat_id=owner_id,
-                                text=f"Channel message wasn't forwarded - {answer.status_code}",
-                            )
-                except Exception as e:
-                    print(type(e))
-                    print(str(e))
-                    if owner_id:
-                        await bot.send_message(
-                            chat_id=owner_id, text="Channel message wasn't forwarded"
-                        )
+    deliveries = []
+    chat_routing = await crud_targets.get_routing(channel_post.chat.id)
+    for target in chat_routing["targets"]:
+        key = target["key"]
+        prefix = target["prefix"]
+
+        message_text_to_send = str(message_text_edited)
+        if prefix:
+            message_text_to_send = f"{prefix}\n{message_text_to_send}"
+
+        if not key or key in matched_keys:
+            deliveries.append(
+                {
+                    "chat_id": channel_post.chat.id,
+                    "target_id": target["id"],
+                    "webhook": target["webhook"],
+                    "payload": {
+                        "content": message_text_to_send,
+                        "files": files,
+                        "media_group_id": channel_post.media_group_id,
+                        "trace": tracer.context(),
+                    },
+                }
+            )
+
+    await crud_deliveries.enqueue_deliveries(deliveries)
+    outbox.wakeup()
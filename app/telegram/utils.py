@@ -1,3 +1,5 @@
+import asyncio
+import re
 from typing import Any
 
 import httpx
@@ -5,6 +7,10 @@ from aiogram import types
 from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from cachetools import TTLCache
+from common.config import cfg
+from common.http import http_pool
+from common.matcher import KeyMatcher
 
 COMMANDS = [
     types.BotCommand(command="start", description="Start bot"),
@@ -109,14 +115,232 @@ def get_choosed_callback_text(keyboards, callback_data) -> str:
                 return button.text
 
 
-async def check_connection(
-    link: str, protocol: str, storage: dict, url_offset: int
-) -> None:
-    try:
-        async with httpx.AsyncClient(
-            transport=httpx.AsyncHTTPTransport(retries=0)
-        ) as ac:
-            await ac.get(f"{protocol}://{link}", timeout=5)
-            storage[(protocol, url_offset)] = True
-    except Exception:
-        pass
+ASTRAL_CHARS = re.compile("[\U00010000-\U0010ffff]")
+
+
+def get_entity_ranges(
+    text: str, entities: list[types.MessageEntity]
+) -> list[tuple[int, int]]:
+    """Python (start, end) indices of entities. Telegram counts offsets in utf-16
+    code units, where chars outside BMP (most of emojis) take two units, so every
+    such char before an entity shifts it by one."""
+    astral = [match.start() for match in ASTRAL_CHARS.finditer(text)]
+    if not astral:
+        return [(entity.offset, entity.offset + entity.length) for entity in entities]
+
+    offsets = sorted(
+        {
+            offset
+            for entity in entities
+            for offset in (entity.offset, entity.offset + entity.length)
+        }
+    )
+    indices = {}
+    shift = 0
+    for offset in offsets:
+        # k-th astral char at index i starts at utf-16 offset i + k
+        while shift < len(astral) and astral[shift] + shift < offset:
+            shift += 1
+        indices[offset] = offset - shift
+
+    return [
+        (indices[entity.offset], indices[entity.offset + entity.length])
+        for entity in entities
+    ]
+
+
+def get_link_preview(
+    text: str,
+    link_ranges: list[tuple[int, int]],
+    link_preview_options: types.LinkPreviewOptions | None,
+    always_link_preview: bool,
+) -> str | None:
+    """Link shown in preview: chosen one or the first link of the post, unless
+    preview is disabled and no target wants it anyway."""
+    if getattr(link_preview_options, "url", None):
+        return link_preview_options.url
+    if (
+        always_link_preview
+        or not hasattr(link_preview_options, "is_disabled")
+        or link_preview_options.is_disabled != True
+        and "link_preview_is_disabled" not in str(link_preview_options.is_disabled)
+    ):
+        if link_ranges:
+            start, end = link_ranges[0]
+            return text[start:end]
+    return None
+
+
+def get_link_replacements(
+    text: str,
+    link_ranges: list[tuple[int, int]],
+    link_schemes: dict[int, str | None],
+    link_preview: str | None,
+) -> tuple[list[tuple[int, int, str]], str | None]:
+    """Links with resolved schemes, wrapped in <> to suppress embeds, except the
+    previewed one, which is returned as forced preview."""
+    links = []
+    forced_link_preview = None
+    for start, end in link_ranges:
+        link = text[start:end]
+        link_original = (
+            link.removeprefix("http://").removeprefix("https://").removeprefix("www.")
+        )
+        if not link.startswith(("http://", "https://")):
+            if link_schemes.get(start):
+                link = f"{link_schemes[start]}://{link}"
+        if link.startswith(("http://", "https://")):
+            if link_preview and link_original in link_preview:
+                forced_link_preview = str(link)
+            else:
+                link = f"<{link}>"
+        links.append((start, end, link))
+    return links, forced_link_preview
+
+
+def replace_links(text: str, links: list[tuple[int, int, str]]) -> str:
+    parts = []
+    position = 0
+    for start, end, replacement in links:
+        parts.append(text[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+def rewrite_text(
+    text: str,
+    links: list[tuple[int, int, str]],
+    key_matcher: KeyMatcher,
+    key_occurrences: list[tuple[int, int, str]],
+) -> tuple[str, str]:
+    """Builds both texts in one pass: text without keys (for editing the post)
+    and text without keys with links replaced (for targets). Links are sorted,
+    non-overlapping (start, end, replacement)."""
+    if not links and not key_occurrences:
+        return text, text
+
+    key_ranges = key_matcher.select(key_occurrences)
+
+    edited_parts = []
+    position = 0
+    for start, end in key_ranges:
+        edited_parts.append(text[position:start])
+        position = end
+    edited_parts.append(text[position:])
+    edited = "".join(edited_parts)
+
+    fixed_parts = []
+    position = 0
+    key_index = 0
+    for link_start, link_end, replacement in links:
+        while key_index < len(key_ranges) and key_ranges[key_index][1] <= link_start:
+            start, end = key_ranges[key_index]
+            fixed_parts.append(text[position:start])
+            position = end
+            key_index += 1
+        fixed_parts.append(text[position:link_start])
+
+        # keys inside of a link are removed from the rewritten link
+        key_in_link = False
+        while key_index < len(key_ranges) and key_ranges[key_index][0] < link_end:
+            start, end = key_ranges[key_index]
+            if start < link_start or end > link_end:
+                # a key crossing the link's boundary is partly rewritten with
+                # it, so keys are removed after links are replaced, as a whole
+                return edited, key_matcher.strip(replace_links(text, links))
+            key_in_link = True
+            key_index += 1
+        fixed_parts.append(
+            key_matcher.strip(replacement) if key_in_link else replacement
+        )
+        position = link_end
+    for start, end in key_ranges[key_index:]:
+        fixed_parts.append(text[position:start])
+        position = end
+    fixed_parts.append(text[position:])
+
+    return edited, "".join(fixed_parts)
+
+
+class SchemeResolver:
+    """Remembers which scheme (https or http) hosts of scheme-less links answer on.
+    Concurrent lookups of the same host share one probe."""
+
+    def __init__(self, ttl: float, negative_ttl: float, timeout: float) -> None:
+        self._schemes = TTLCache(ttl=ttl, maxsize=10000)
+        self._missing = TTLCache(ttl=negative_ttl, maxsize=10000)
+        self._probes: dict[str, asyncio.Future] = {}
+        self._timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, link: str) -> str | None:
+        try:
+            host = httpx.URL(f"http://{link}").host
+        except httpx.InvalidURL:
+            return None
+        if host in self._schemes:
+            self.hits += 1
+            return self._schemes[host]
+        if host in self._missing:
+            self.hits += 1
+            return None
+
+        self.misses += 1
+        probe = self._probes.get(host)
+        if probe is None:
+            probe = asyncio.ensure_future(self._probe(host, link))
+            self._probes[host] = probe
+        # shielded, so a cancelled post doesn't cancel the probe for the others
+        return await asyncio.shield(probe)
+
+    async def _probe(self, host: str, link: str) -> str | None:
+        try:
+            https = asyncio.ensure_future(self._check(f"https://{link}"))
+            http = asyncio.ensure_future(self._check(f"http://{link}"))
+            scheme = None
+            if await https:
+                http.cancel()
+                scheme = "https"
+            elif await http:
+                scheme = "http"
+
+            if scheme:
+                self._schemes[host] = scheme
+            else:
+                self._missing[host] = True
+            return scheme
+        finally:
+            self._probes.pop(host, None)
+
+    async def _check(self, url: str) -> bool:
+        # any answer means that host is reachable by this scheme, HEAD doesn't
+        # download the page, GET is for servers that break on HEAD
+        try:
+            await http_pool.client.head(url, timeout=self._timeout)
+            return True
+        except (httpx.ConnectError, httpx.TimeoutException):
+            return False
+        except Exception:
+            pass
+        try:
+            await http_pool.client.get(url, timeout=self._timeout)
+            return True
+        except Exception:
+            return False
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "schemes": len(self._schemes),
+            "missing": len(self._missing),
+            "probes": len(self._probes),
+        }
+
+
+scheme_resolver = SchemeResolver(
+    cfg.PROBE_CACHE_TTL, cfg.PROBE_NEGATIVE_TTL, cfg.PROBE_TIMEOUT
+)
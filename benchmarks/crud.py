@@ -0,0 +1,289 @@
+"""Calls per second and statements per call of chats and targets CRUD on SQLite,
+old read-then-write implementations against the single statement ones.
+
+Directory caches are bypassed, so every call goes to the database, except
+get_routing, which is compared with the routing snapshot. Commits are counted
+as statements, a read only session has none. New writes include the routing
+version bump.
+
+    python benchmarks/crud.py --calls 2000
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from itertools import count
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from common.config import cfg
+
+cfg.data = {}
+cfg.load_settings()
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="wftb-crud-"), "crud.db")
+cfg.DB_CONNECTION_STRING = f"sqlite+aiosqlite:///{DB_PATH}"
+
+from crud import chats as crud_chats
+from crud import targets as crud_targets
+from crud.routing import RoutingTable, build_routing
+from db.models import Base, Chats, Targets
+from db.utils import _engine, _read_engine, async_session, dispose_engines
+from sqlalchemy import event, insert, select, update
+
+OWNER_ID = 1000
+CHAT_ID = -1001
+
+
+class UncachedDirectory(crud_chats.ChatDirectory):
+    def get_owner(self, chat_id: int) -> Any:
+        return crud_chats._UNKNOWN
+
+    def get_owned_chats(self, owner_id: int) -> Any:
+        return crud_chats._UNKNOWN
+
+
+crud_chats.chat_directory = UncachedDirectory()
+# started tables serve lookups from the snapshot, this one is only refreshed
+snapshot_table = RoutingTable()
+
+
+async def old_check_webhook(webhook: str) -> bool:
+    async with async_session() as session:
+        async with session.begin():
+            db_target = await session.scalar(
+                select(Targets).where(Targets.webhook == webhook)
+            )
+            if db_target:
+                return True
+            return False
+
+
+async def old_add_target(webhook: str, name: str, chat_id: int) -> bool:
+    async with async_session() as session:
+        async with session.begin():
+            db_target = await session.scalar(
+                select(Targets).where(
+                    Targets.webhook == webhook, Targets.chat_id == chat_id
+                )
+            )
+            if db_target:
+                return False
+
+            await session.execute(
+                insert(Targets).values(
+                    {
+                        "webhook": webhook,
+                        "name": name,
+                        "chat_id": chat_id,
+                        "key": None,
+                        "prefix": None,
+                        "always_link_preview": False,
+                    }
+                )
+            )
+        return True
+
+
+async def old_update_target(target_id: int, update_data: dict[str, str]) -> bool:
+    async with async_session() as session:
+        async with session.begin():
+            db_target = await session.scalar(
+                select(Targets).where(Targets.id == target_id)
+            )
+            if not db_target:
+                return False
+
+            await session.execute(
+                update(Targets).where(Targets.id == target_id).values(update_data)
+            )
+        return True
+
+
+async def old_get_targets(chat_id: int) -> list[dict[str, Any]]:
+    async with async_session() as session:
+        async with session.begin():
+            db_targets = await session.scalars(
+                select(Targets).where(Targets.chat_id == chat_id)
+            )
+            return [
+                {
+                    "id": target.id,
+                    "webhook": target.webhook,
+                    "name": target.name,
+                    "key": target.key,
+                    "prefix": target.prefix,
+                    "always_link_preview": target.always_link_preview,
+                }
+                for target in db_targets
+            ]
+
+
+async def old_add_chat(chat_id: int, owner_id: int) -> bool:
+    async with async_session() as session:
+        async with session.begin():
+            db_chat = await session.scalar(select(Chats).where(Chats.id == chat_id))
+            if db_chat:
+                return False
+
+            await session.execute(
+                insert(Chats).values({"id": chat_id, "owner_id": owner_id})
+            )
+        return True
+
+
+async def old_get_owner(chat_id: int) -> int | None:
+    async with async_session() as session:
+        async with session.begin():
+            db_chat = await session.scalar(select(Chats).where(Chats.id == chat_id))
+            return db_chat.owner_id if db_chat else None
+
+
+async def old_get_owned_chats(owner_id: int) -> list[int]:
+    async with async_session() as session:
+        async with session.begin():
+            db_chats = await session.scalars(
+                select(Chats).where(Chats.owner_id == owner_id)
+            )
+            return [chat.id for chat in db_chats]
+
+
+async def old_get_routing(chat_id: int) -> dict[str, Any]:
+    return build_routing(await old_get_targets(chat_id))
+
+
+async def snapshot_get_routing(chat_id: int) -> dict[str, Any]:
+    return snapshot_table.snapshot.get_routing(chat_id)
+
+
+def make_cases() -> dict[str, tuple[Callable[[], Awaitable], Callable[[], Awaitable]]]:
+    ids = count(1)
+    webhook = "https://example.com/hook/1"
+    return {
+        "check_webhook": (
+            lambda: old_check_webhook(webhook),
+            lambda: crud_targets.check_webhook(webhook),
+        ),
+        "add_target": (
+            lambda: old_add_target(f"https://new.com/{next(ids)}", "new", CHAT_ID),
+            lambda: crud_targets.add_target(
+                f"https://new.com/{next(ids)}", "new", CHAT_ID, None, None, False
+            ),
+        ),
+        "add_target_taken": (
+            lambda: old_add_target(webhook, "new", CHAT_ID),
+            lambda: crud_targets.add_target(webhook, "new", CHAT_ID, None, None, False),
+        ),
+        "update_target": (
+            lambda: old_update_target(2, {"name": "edited"}),
+            lambda: crud_targets.update_target(2, {"name": "edited"}),
+        ),
+        "get_targets": (
+            lambda: old_get_targets(CHAT_ID),
+            lambda: crud_targets.get_targets(CHAT_ID),
+        ),
+        "add_chat": (
+            lambda: old_add_chat(-1_000_000 - next(ids), OWNER_ID),
+            lambda: crud_chats.add_chat(-1_000_000 - next(ids), OWNER_ID),
+        ),
+        "add_chat_taken": (
+            lambda: old_add_chat(CHAT_ID, OWNER_ID),
+            lambda: crud_chats.add_chat(CHAT_ID, OWNER_ID),
+        ),
+        "get_routing": (
+            lambda: old_get_routing(CHAT_ID),
+            lambda: snapshot_get_routing(CHAT_ID),
+        ),
+        "get_owner": (
+            lambda: old_get_owner(CHAT_ID),
+            lambda: crud_chats.get_owner(CHAT_ID),
+        ),
+        "get_owned_chats": (
+            lambda: old_get_owned_chats(OWNER_ID + 1),
+            lambda: crud_chats.get_owned_chats(OWNER_ID + 1),
+        ),
+    }
+
+
+async def create_database() -> None:
+    async with _engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(
+            insert(Chats),
+            [
+                {"id": -1000 - number, "owner_id": OWNER_ID + number % 10}
+                for number in range(100)
+            ],
+        )
+        await conn.execute(
+            insert(Targets),
+            [
+                {
+                    "webhook": f"https://example.com/hook/{number}",
+                    "name": f"target{number}",
+                    "chat_id": -1000 - number % 100,
+                    "key": f"#key{number % 5}" if number % 2 else None,
+                    "prefix": None,
+                    "always_link_preview": False,
+                }
+                for number in range(300)
+            ],
+        )
+
+
+async def measure(call: Callable[[], Awaitable], calls: int) -> tuple[float, float]:
+    """Calls per second and statements, commits included, per call."""
+    statements = 0
+
+    def count_statement(*args: Any) -> None:
+        nonlocal statements
+        statements += 1
+
+    engines = {_engine.sync_engine, _read_engine.sync_engine}
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", count_statement)
+        event.listen(engine, "commit", count_statement)
+    try:
+        start = time.perf_counter()
+        for _ in range(calls):
+            await call()
+        seconds = time.perf_counter() - start
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", count_statement)
+            event.remove(engine, "commit", count_statement)
+    return calls / seconds, statements / calls
+
+
+async def main() -> None:
+    parser = ArgumentParser(description="Chats and targets CRUD benchmark")
+    parser.add_argument("--calls", type=int, default=2000, help="per case")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    await create_database()
+    await snapshot_table.refresh()
+    for name, (old, new) in make_cases().items():
+        await old()
+        await new()
+        # alternating rounds, so both see the same table sizes
+        old_ops = new_ops = 0.0
+        for _ in range(args.rounds):
+            ops, old_statements = await measure(old, args.calls // args.rounds)
+            old_ops = max(old_ops, ops)
+            ops, new_statements = await measure(new, args.calls // args.rounds)
+            new_ops = max(new_ops, ops)
+        print(
+            f"{name:17} old {old_ops:7.0f}/s {old_statements:.0f} statements"
+            f"  new {new_ops:7.0f}/s {new_statements:.0f} statements"
+            f"  x{new_ops / old_ops:.2f}"
+        )
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
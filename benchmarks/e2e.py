@@ -0,0 +1,112 @@
+"""End-to-end throughput of the bot, fully offline.
+
+Boots main.py on SQLite with local Bot API and webhook receiver, fires
+synthetic channel posts (text with url entities and keys, albums) at
+/webhooks/telegram and waits for their deliveries.
+
+    python benchmarks/e2e.py --posts 500 --concurrency 20
+    python benchmarks/e2e.py --posts 200 --rate 50 --webhook-latency 0.05
+"""
+
+import asyncio
+import json
+import time
+from argparse import ArgumentParser
+
+import httpx
+from harness import Environment, PostFactory, report
+
+
+async def main() -> None:
+    parser = ArgumentParser(description="End-to-end benchmark")
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument(
+        "--rate", type=float, default=0, help="posts per second, 0 is max"
+    )
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--album-share", type=float, default=0.2)
+    parser.add_argument("--url-share", type=float, default=0.5)
+    parser.add_argument("--key-share", type=float, default=0.5)
+    parser.add_argument("--targets", type=int, default=3, help="targets with keys")
+    parser.add_argument("--webhook-latency", type=float, default=0.0)
+    parser.add_argument("--webhook-error-rate", type=float, default=0.0)
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--json", dest="json_path", help="write results here")
+    args = parser.parse_args()
+
+    keys = [f"#key{number}" for number in range(args.targets)]
+    targets = [{"key": None, "prefix": None}] + [
+        {"key": key, "prefix": f"[{key}]"} for key in keys
+    ]
+    settings = {
+        "media_group": {"quiet_window": 0.5, "max_wait": 3},
+        "outbox": {"poll_interval": 0.2, "backoff_base": 0.2, "backoff_max": 2},
+        "prefilter": {"refresh_interval": 60},
+    }
+
+    async with Environment(
+        targets,
+        args.webhook_latency,
+        args.webhook_error_rate,
+        args.api_latency,
+        settings,
+    ) as env:
+        factory = PostFactory(
+            env.receiver.url.removeprefix("http://"),
+            keys,
+            args.album_share,
+            args.url_share,
+            args.key_share,
+        )
+        posts = [factory.make(number) for number in range(args.posts)]
+        expected = {
+            (number, hook)
+            for number, (_, post_keys) in enumerate(posts)
+            for hook in env.expected_hooks(post_keys)
+        }
+
+        sent = {}
+        ingress = []
+        queue = asyncio.Queue()
+        for number in range(args.posts):
+            queue.put_nowait(number)
+
+        started = time.time()
+        async with httpx.AsyncClient(timeout=60) as client:
+
+            async def sender() -> None:
+                while not queue.empty():
+                    number = queue.get_nowait()
+                    if args.rate:
+                        delay = started + number / args.rate - time.time()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    sent[number] = time.time()
+                    for update in posts[number][0]:
+                        ingress.append(await env.send(client, update))
+
+            await asyncio.gather(*[sender() for _ in range(args.concurrency)])
+
+        await env.wait_deliveries(expected, args.timeout)
+        result = report(
+            "e2e",
+            sent,
+            expected,
+            env.receiver.arrivals,
+            ingress,
+            started,
+            env.app.peak_rss(),
+        )
+        result["bot_api_calls"] = env.bot_api.calls
+        result["webhook_requests"] = env.receiver.requests
+        result["webhook_errors"] = env.receiver.errors
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
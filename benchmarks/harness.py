@@ -0,0 +1,514 @@
+"""Offline stand-ins for everything the bot talks to and a runner of the app.
+
+FakeSecrets answers the secrets service request made on start, FakeBotAPI is
+a local Bot API (pointed to with bot_api.server) and WebhookReceiver plays
+targets' webhooks with configurable latency and error rate. AppProcess boots
+main.py on SQLite with all of them, the way it is started in production.
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+import yaml
+from aiohttp import web
+from sqlalchemy import create_engine, insert
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+from db.models import Base, Chats, Targets
+
+BOT_TOKEN = "123456:BENCHMARK"
+BOT_SECRET = "benchmark-secret"
+OWNER_ID = 1000
+CHAT_ID = -1001000000000
+MARKER = re.compile(r"post-(\d+)")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def percentile(values: list[float], share: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+class LocalServer:
+    def __init__(self) -> None:
+        self.app = web.Application(client_max_size=64 * 1024 * 1024)
+        self.port = free_port()
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class FakeSecrets(LocalServer):
+    def __init__(self, db_path: str, env: str = "dev") -> None:
+        super().__init__()
+        self.content = {
+            f"{env}/db/sqlite": {"path": db_path},
+            f"{env}/owner": {"login": "owner", "id": OWNER_ID},
+            f"{env}/domain": {"domain": "bench.local"},
+            f"{env}/telegram": {
+                "token": BOT_TOKEN,
+                "secret": BOT_SECRET,
+                "allowed": ["owner"],
+            },
+        }
+        self.app.router.add_get("/api/secrets", self.secrets)
+
+    async def secrets(self, request: web.Request) -> web.Response:
+        return web.json_response({"content": self.content})
+
+
+class FakeBotAPI(LocalServer):
+    """Answers every method with a plausible result, files are random bytes."""
+
+    def __init__(self, latency: float = 0.0, file_size: int = 64 * 1024) -> None:
+        super().__init__()
+        self.latency = latency
+        self.file = random.randbytes(file_size)
+        self.calls: dict[str, int] = {}
+        self.app.router.add_post("/bot{token}/{method}", self.method)
+        self.app.router.add_get("/file/bot{token}/{path:.*}", self.download)
+
+    async def method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        params = dict(await request.post())
+        result: Any = True
+        if method in ("editMessageText", "editMessageCaption", "sendMessage"):
+            result = {
+                "message_id": int(params.get("message_id", 1)),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", CHAT_ID)), "type": "channel"},
+            }
+        elif method == "getMe":
+            result = {
+                "id": 123456,
+                "is_bot": True,
+                "first_name": "Bench",
+                "username": "bench_bot",
+            }
+        elif method == "getFile":
+            result = {
+                "file_id": params["file_id"],
+                "file_unique_id": params["file_id"],
+                "file_size": len(self.file),
+                "file_path": f"photos/{params['file_id']}.jpg",
+            }
+        return web.json_response({"ok": True, "result": result})
+
+    async def download(self, request: web.Request) -> web.Response:
+        self.calls["download"] = self.calls.get("download", 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(body=self.file)
+
+
+class WebhookReceiver(LocalServer):
+    """Targets' webhooks, records arrival time of every post by its marker.
+    Also answers scheme probes of links pointing here."""
+
+    def __init__(
+        self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0
+    ) -> None:
+        super().__init__()
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        # (post number, hook) -> arrival time of the first successful delivery
+        self.arrivals: dict[tuple[int, str], float] = {}
+        # arrival times of all successful deliveries, with marker or not
+        self.delivered: list[float] = []
+        self.requests = 0
+        self.errors = 0
+        self.app.router.add_post("/hook/{name}", self.hook)
+        self.app.router.add_route("*", "/page/{path:.*}", self.page)
+
+    async def hook(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if request.content_type == "application/json":
+            content = (await request.json()).get("content", "")
+        else:
+            content = (await request.post()).get("content", "")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503)
+
+        self.delivered.append(time.time())
+        match = MARKER.search(content)
+        if match:
+            key = (int(match.group(1)), request.match_info["name"])
+            self.arrivals.setdefault(key, time.time())
+        return web.Response(status=204)
+
+    async def page(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+
+class PostFactory:
+    """Synthetic channel posts: text with url entities and keys, and albums.
+    Each post carries 'post-<n>' marker, so its deliveries can be matched."""
+
+    def __init__(
+        self,
+        page_host: str,
+        keys: list[str],
+        album_share: float = 0.2,
+        url_share: float = 0.5,
+        key_share: float = 0.5,
+        seed: int = 0,
+    ) -> None:
+        self.page_host = page_host
+        self.keys = keys
+        self.album_share = album_share
+        self.url_share = url_share
+        self.key_share = key_share
+        self._random = random.Random(seed)
+        self._update_id = 1
+        self._message_id = 1
+        self._media_group_id = 1
+
+    def _next_update(self, post: dict[str, Any]) -> dict[str, Any]:
+        update = {"update_id": self._update_id, "channel_post": post}
+        self._update_id += 1
+        return update
+
+    def _message(self) -> dict[str, Any]:
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": CHAT_ID, "type": "channel", "title": "Benchmark"},
+            "sender_chat": {"id": CHAT_ID, "type": "channel", "title": "Benchmark"},
+        }
+        self._message_id += 1
+        return message
+
+    def _text(self, number: int) -> tuple[str, list[dict[str, Any]], list[str]]:
+        text = f"Post post-{number} 📰 some news text 🎉 with details"
+        entities = []
+        keys = []
+        if self._random.random() < self.url_share:
+            for link in (
+                f"https://{self.page_host}/page/{number}",
+                f"{self.page_host}/page/{number}/more",
+            ):
+                text += " "
+                entities.append(
+                    {
+                        "type": "url",
+                        "offset": utf16_len(text),
+                        "length": utf16_len(link),
+                    }
+                )
+                text += link
+        if self.keys and self._random.random() < self.key_share:
+            key = self._random.choice(self.keys)
+            keys.append(key)
+            text += f"\n{key}"
+        return text, entities, keys
+
+    def make(self, number: int) -> tuple[list[dict[str, Any]], list[str]]:
+        """Updates of one post and keys it carries."""
+        text, entities, keys = self._text(number)
+        if self._random.random() >= self.album_share:
+            post = self._message()
+            post["text"] = text
+            if entities:
+                post["entities"] = entities
+            return [self._next_update(post)], keys
+
+        updates = []
+        media_group_id = str(self._media_group_id)
+        self._media_group_id += 1
+        for part in range(3):
+            post = self._message()
+            post["media_group_id"] = media_group_id
+            file_id = f"photo-{number}-{part}"
+            post["photo"] = [
+                {
+                    "file_id": file_id,
+                    "file_unique_id": file_id,
+                    "width": 1280,
+                    "height": 720,
+                    "file_size": 64 * 1024,
+                }
+            ]
+            if part == 0:
+                post["caption"] = text
+                if entities:
+                    post["caption_entities"] = entities
+            updates.append(self._next_update(post))
+        return updates, keys
+
+
+class AppProcess:
+    """main.py in a subprocess, with its own config dir and SQLite database
+    filled with the benchmark channel and its targets."""
+
+    def __init__(
+        self,
+        secrets: FakeSecrets,
+        bot_api: FakeBotAPI,
+        settings: dict[str, Any] | None = None,
+        workdir: str | None = None,
+    ) -> None:
+        self.workdir = Path(workdir or tempfile.mkdtemp(prefix="wftb-bench-"))
+        self.secrets = secrets
+        self.bot_api = bot_api
+        self.settings = settings or {}
+        self.port = free_port()
+        self.process: subprocess.Popen | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @staticmethod
+    def create_database(db_path: str, targets: list[dict[str, Any]]) -> None:
+        engine = create_engine(
+            f"sqlite:///{db_path}",
+            execution_options={"schema_translate_map": {"wftb": None}},
+        )
+        Base.metadata.create_all(engine)
+        chat_ids = {OWNER_ID} | {target["chat_id"] for target in targets}
+        with engine.begin() as conn:
+            conn.execute(
+                insert(Chats),
+                [{"id": chat_id, "owner_id": OWNER_ID} for chat_id in chat_ids],
+            )
+            conn.execute(
+                insert(Targets),
+                [
+                    {
+                        "name": f"target{number}",
+                        "always_link_preview": False,
+                        **target,
+                    }
+                    for number, target in enumerate(targets)
+                ],
+            )
+        engine.dispose()
+
+    def write_config(self) -> None:
+        config = {
+            "secrets_domain": self.secrets.url,
+            "secrets_header": "X-Bench",
+            "secrets_token": "bench",
+            "bot_api": {"server": self.bot_api.url},
+            "logging": {"level": "WARNING"},
+        }
+        for section, values in self.settings.items():
+            config.setdefault(section, {}).update(values)
+        (self.workdir / "config").mkdir(parents=True, exist_ok=True)
+        with open(self.workdir / "config" / "config.yaml", "w") as f:
+            yaml.safe_dump(config, f)
+
+    async def start(self, timeout: float = 30) -> None:
+        self.write_config()
+        self.log = open(self.workdir / "app.log", "w")
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                str(APP_DIR / "main.py"),
+                "-H",
+                "127.0.0.1",
+                "-P",
+                str(self.port),
+                "-E",
+                "dev",
+            ],
+            cwd=self.workdir,
+            stdout=self.log,
+            stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"App exited, see {self.workdir / 'app.log'}")
+                try:
+                    await client.get(f"{self.url}/metrics")
+                    return
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+        raise RuntimeError(f"App didn't start, see {self.workdir / 'app.log'}")
+
+    def peak_rss(self) -> int | None:
+        """Peak resident memory of the app in bytes, Linux only."""
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+
+    async def stop(self, timeout: float = 30) -> None:
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            # graceful, so lifespan flushes media groups and stops the outbox
+            self.process.send_signal(signal.SIGINT)
+            try:
+                await asyncio.to_thread(self.process.wait, timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+
+
+class Environment:
+    """Stand-in servers plus the app, started and stopped together."""
+
+    def __init__(
+        self,
+        targets: list[dict[str, Any]],
+        webhook_latency: float = 0.0,
+        webhook_error_rate: float = 0.0,
+        api_latency: float = 0.0,
+        settings: dict[str, Any] | None = None,
+        chat_ids: list[int] | None = None,
+    ) -> None:
+        self.workdir = tempfile.mkdtemp(prefix="wftb-bench-")
+        db_path = os.path.join(self.workdir, "bench.db")
+        self.receiver = WebhookReceiver(webhook_latency, webhook_error_rate)
+        self.secrets = FakeSecrets(db_path)
+        self.bot_api = FakeBotAPI(api_latency)
+        # every chat gets the same set of targets, webhooks are known only
+        # after receiver got its port
+        self.targets = [
+            {**target, "chat_id": chat_id}
+            for chat_id in chat_ids or [CHAT_ID]
+            for target in targets
+        ]
+        for number, target in enumerate(self.targets):
+            target["webhook"] = f"{self.receiver.url}/hook/{number}"
+        AppProcess.create_database(db_path, self.targets)
+        self.app = AppProcess(self.secrets, self.bot_api, settings, self.workdir)
+
+    async def __aenter__(self) -> "Environment":
+        await self.receiver.start()
+        await self.secrets.start()
+        await self.bot_api.start()
+        await self.app.start()
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.app.stop()
+        await self.bot_api.stop()
+        await self.secrets.stop()
+        await self.receiver.stop()
+
+    def expected_hooks(self, keys: list[str], chat_id: int = CHAT_ID) -> list[str]:
+        """Hooks a post with these keys is forwarded to."""
+        return [
+            str(number)
+            for number, target in enumerate(self.targets)
+            if target["chat_id"] == chat_id
+            and (not target.get("key") or target["key"] in keys)
+        ]
+
+    async def send(self, client: httpx.AsyncClient, update: dict[str, Any]) -> float:
+        """Posts update to the app, returns response time."""
+        start = time.perf_counter()
+        response = await client.post(
+            f"{self.app.url}/webhooks/telegram",
+            content=json.dumps(update),
+            headers={
+                "content-type": "application/json",
+                "X-Telegram-Bot-Api-Secret-Token": BOT_SECRET,
+            },
+        )
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    async def wait_deliveries(
+        self, expected: set[tuple[int, str]], timeout: float
+    ) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if expected <= self.receiver.arrivals.keys():
+                return
+            await asyncio.sleep(0.05)
+
+
+def report(
+    name: str,
+    sent: dict[int, float],
+    expected: set[tuple[int, str]],
+    arrivals: dict[tuple[int, str], float],
+    ingress: list[float],
+    started: float,
+    peak_rss: int | None,
+) -> dict[str, Any]:
+    delivered = [key for key in expected if key in arrivals]
+    latencies = [arrivals[key] - sent[key[0]] for key in delivered]
+    finished = max([arrivals[key] for key in delivered], default=started)
+    duration = max(finished - started, 1e-9)
+    result = {
+        "name": name,
+        "updates": len(ingress),
+        "deliveries_expected": len(expected),
+        "deliveries": len(delivered),
+        "duration": duration,
+        "throughput": len(delivered) / duration,
+        "ingress_p50": percentile(ingress, 0.5),
+        "ingress_p95": percentile(ingress, 0.95),
+        "ingress_p99": percentile(ingress, 0.99),
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "peak_rss": peak_rss,
+    }
+    rss = f"{peak_rss / 1024 / 1024:.1f} MiB" if peak_rss else "n/a"
+    print(
+        f"{name}: {result['deliveries']}/{result['deliveries_expected']} deliveries"
+        f" of {result['updates']} updates in {duration:.2f}s,"
+        f" {result['throughput']:.1f} deliveries/s\n"
+        f"  ingress  p50 {result['ingress_p50'] * 1000:.1f}ms"
+        f" p95 {result['ingress_p95'] * 1000:.1f}ms"
+        f" p99 {result['ingress_p99'] * 1000:.1f}ms\n"
+        f"  delivery p50 {result['latency_p50'] * 1000:.1f}ms"
+        f" p95 {result['latency_p95'] * 1000:.1f}ms"
+        f" p99 {result['latency_p99'] * 1000:.1f}ms\n"
+        f"  peak rss {rss}"
+    )
+    return result
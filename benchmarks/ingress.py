@@ -0,0 +1,134 @@
+"""Requests per second of /webhooks/telegram ingress, old route against the new one.
+
+Both routes feed the same dispatcher with a no-op channel_post handler, so the
+difference is decoding, validation and dumping of the update.
+
+    python benchmarks/ingress.py --requests 5000 --concurrency 50
+"""
+
+import asyncio
+import sys
+import time
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from os import devnull
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+import httpx
+from aiogram import Bot, Dispatcher, Router, types
+from common.config import cfg
+from fastapi import BackgroundTasks, FastAPI, Request
+
+cfg.data = {}
+cfg.load_settings()
+# prefilter isn't started, database isn't touched
+cfg.DB_CONNECTION_STRING = "sqlite+aiosqlite://"
+
+from telegram.ingress import build_update, load_update
+
+UPDATE = {
+    "update_id": 100000001,
+    "channel_post": {
+        "message_id": 42,
+        "date": 1700000000,
+        "chat": {"id": -1001234567890, "type": "channel", "title": "Channel"},
+        "sender_chat": {"id": -1001234567890, "type": "channel", "title": "Channel"},
+        "text": "Some news 🎉 with link example.com and https://example.org/path #news",
+        "entities": [
+            {"type": "url", "offset": 25, "length": 11},
+            {"type": "url", "offset": 41, "length": 24},
+            {"type": "hashtag", "offset": 66, "length": 5},
+            {"type": "bold", "offset": 0, "length": 4},
+        ],
+        "link_preview_options": {"url": "https://example.org/path"},
+    },
+}
+
+
+def make_app(bot: Bot, dp: Dispatcher, new: bool) -> FastAPI:
+    app = FastAPI()
+
+    if new:
+
+        @app.post("/webhooks/telegram")
+        async def webhook_telegram(request: Request, background_tasks: BackgroundTasks):
+            update = load_update(await request.body())
+            telegram_update = build_update(update, bot)
+            if update.get("channel_post"):
+                background_tasks.add_task(dp.feed_webhook_update, bot, telegram_update)
+            else:
+                await dp.feed_webhook_update(bot=bot, update=telegram_update)
+
+    else:
+
+        @app.post("/webhooks/telegram")
+        async def webhook_telegram(update: dict, background_tasks: BackgroundTasks):
+            print(update)
+            telegram_update = types.Update(**update)
+            if update.get("channel_post"):
+                background_tasks.add_task(dp.feed_webhook_update, bot, telegram_update)
+            else:
+                await dp.feed_webhook_update(bot=bot, update=telegram_update)
+
+    return app
+
+
+async def run(app: FastAPI, requests: int, concurrency: int) -> float:
+    body = httpx.Request("POST", "http://bench", json=UPDATE).read()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        queue = asyncio.Queue()
+        for _ in range(requests):
+            queue.put_nowait(None)
+
+        async def worker() -> None:
+            while not queue.empty():
+                queue.get_nowait()
+                response = await client.post(
+                    "/webhooks/telegram",
+                    content=body,
+                    headers={"content-type": "application/json"},
+                )
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return requests / (time.perf_counter() - start)
+
+
+async def main() -> None:
+    parser = ArgumentParser(description="Ingress benchmark")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    bot = Bot(token="123456:BENCHMARK")
+    dp = Dispatcher()
+    router = Router()
+
+    @router.channel_post()
+    async def channel_post_handler(channel_post: types.Message) -> None:
+        pass
+
+    dp.include_router(router)
+
+    for name, new in (("old", False), ("new", True)):
+        app = make_app(bot, dp, new)
+        results = []
+        # update dumps go to /dev/null, not to a terminal
+        with open(devnull, "w") as null, redirect_stdout(null):
+            await run(app, args.concurrency, args.concurrency)
+            for _ in range(args.rounds):
+                results.append(await run(app, args.requests, args.concurrency))
+        print(f"{name}: {max(results):.0f} req/s (best of {args.rounds})")
+
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,199 @@
+"""Replays updates recorded by the recorder (recorder section of config.yaml)
+into the bot, fully offline, with the stand-ins of benchmarks/harness.py.
+
+Every channel seen in the recording is registered with a keyless target and
+a target per --keys, so the same workload can be compared between builds.
+Arrival gaps are kept at --speed 1, shrunk N times at --speed N, and ignored
+at --speed 0.
+
+    python benchmarks/replay.py recordings/ --speed 1
+    python benchmarks/replay.py recordings/updates-*.jsonl.gz --speed 10
+    python benchmarks/replay.py recordings/ --speed 0 --keys "#news,#sport"
+"""
+
+import asyncio
+import gzip
+import json
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Any
+
+import httpx
+from harness import Environment, percentile
+
+
+def load_recording(paths: list[str], limit: int | None) -> list[tuple[float, dict]]:
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(path.glob("*.jsonl.gz")))
+        else:
+            files.append(path)
+
+    records = []
+    for file in sorted(files):
+        opener = gzip.open if file.suffix == ".gz" else open
+        with opener(file, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    records.append((record["t"], record["update"]))
+    records.sort(key=lambda record: record[0])
+    return records[:limit] if limit else records
+
+
+def channel_ids(records: list[tuple[float, dict]]) -> list[int]:
+    chat_ids = set()
+    for _, update in records:
+        post = update.get("channel_post") or update.get("edited_channel_post")
+        if post:
+            chat_ids.add(post["chat"]["id"])
+    return sorted(chat_ids)
+
+
+async def replay(
+    env: Environment,
+    records: list[tuple[float, dict]],
+    speed: float,
+    concurrency: int,
+) -> dict[str, Any]:
+    ingress = []
+    lags = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def send(client: httpx.AsyncClient, update: dict[str, Any]) -> None:
+        nonlocal errors
+        try:
+            ingress.append(await env.send(client, update))
+        except httpx.HTTPError:
+            errors += 1
+        finally:
+            semaphore.release()
+
+    first = records[0][0]
+    started = time.time()
+    async with httpx.AsyncClient(timeout=60) as client:
+        for arrived, update in records:
+            if speed:
+                due = started + (arrived - first) / speed
+                delay = due - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                lags.append(max(0.0, time.time() - due))
+            await semaphore.acquire()
+            task = asyncio.create_task(send(client, update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+
+    return {
+        "started": started,
+        "sent": time.time(),
+        "ingress": ingress,
+        "lags": lags,
+        "errors": errors,
+    }
+
+
+async def wait_drained(env: Environment, idle: float, timeout: float) -> None:
+    """Until no deliveries arrive for idle seconds."""
+    deadline = time.monotonic() + timeout
+    count = -1
+    changed = time.monotonic()
+    while time.monotonic() < deadline:
+        if len(env.receiver.delivered) != count:
+            count = len(env.receiver.delivered)
+            changed = time.monotonic()
+        elif time.monotonic() - changed >= idle:
+            return
+        await asyncio.sleep(0.1)
+
+
+async def main() -> None:
+    parser = ArgumentParser(description="Replay of recorded updates")
+    parser.add_argument("paths", nargs="+", help="segments or directories")
+    parser.add_argument("--speed", type=float, default=1, help="0 is max")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=40,
+        help="requests in flight, Telegram's default max_connections is 40",
+    )
+    parser.add_argument("--limit", type=int, help="first N updates")
+    parser.add_argument("--keys", default="", help="comma separated target keys")
+    parser.add_argument("--webhook-latency", type=float, default=0.0)
+    parser.add_argument("--webhook-error-rate", type=float, default=0.0)
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    parser.add_argument("--idle", type=float, default=3, help="drain idle time, s")
+    parser.add_argument("--timeout", type=float, default=300, help="drain timeout, s")
+    parser.add_argument("--json", dest="json_path", help="write results here")
+    args = parser.parse_args()
+
+    records = load_recording(args.paths, args.limit)
+    if not records:
+        print("No updates recorded")
+        return
+    keys = [key.strip() for key in args.keys.split(",") if key.strip()]
+    targets = [{"key": None, "prefix": None}] + [
+        {"key": key, "prefix": None} for key in keys
+    ]
+    settings = {"outbox": {"backoff_base": 0.2, "backoff_max": 2}}
+
+    async with Environment(
+        targets,
+        args.webhook_latency,
+        args.webhook_error_rate,
+        args.api_latency,
+        settings,
+        channel_ids(records),
+    ) as env:
+        result = await replay(env, records, args.speed, args.concurrency)
+        await wait_drained(env, args.idle, args.timeout)
+        delivered = env.receiver.delivered
+        finished = max(delivered, default=result["sent"])
+        result = {
+            "updates": len(records),
+            "recorded_seconds": records[-1][0] - records[0][0],
+            "speed": args.speed,
+            "replay_seconds": result["sent"] - result["started"],
+            "send_errors": result["errors"],
+            # no schedule at --speed 0
+            "schedule_lag_p99": percentile(result["lags"], 0.99) if args.speed else 0.0,
+            "ingress_p50": percentile(result["ingress"], 0.5),
+            "ingress_p95": percentile(result["ingress"], 0.95),
+            "ingress_p99": percentile(result["ingress"], 0.99),
+            "deliveries": len(delivered),
+            "delivery_throughput": len(delivered)
+            / max(finished - result["started"], 1e-9),
+            "drain_seconds": max(0.0, finished - result["sent"]),
+            "webhook_requests": env.receiver.requests,
+            "peak_rss": env.app.peak_rss(),
+            "bot_api_calls": env.bot_api.calls,
+        }
+
+    rss = result["peak_rss"]
+    rss = f"{rss / 1024 / 1024:.1f} MiB" if rss else "n/a"
+    print(
+        f"replay: {result['updates']} updates recorded over"
+        f" {result['recorded_seconds']:.1f}s, sent in {result['replay_seconds']:.2f}s"
+        f" ({result['send_errors']} errors,"
+        f" schedule lag p99 {result['schedule_lag_p99'] * 1000:.1f}ms)\n"
+        f"  ingress  p50 {result['ingress_p50'] * 1000:.1f}ms"
+        f" p95 {result['ingress_p95'] * 1000:.1f}ms"
+        f" p99 {result['ingress_p99'] * 1000:.1f}ms\n"
+        f"  {result['deliveries']} deliveries,"
+        f" {result['delivery_throughput']:.1f}/s,"
+        f" drained {result['drain_seconds']:.2f}s after the last update\n"
+        f"  peak rss {rss}"
+    )
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
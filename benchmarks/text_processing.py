@@ -0,0 +1,260 @@
+"""Microbenchmarks of post text processing with a regression gate.
+
+Runs what ForwardChannelMiddleware does with a post's text (key search, UTF-16
+entity offsets, link preview selection, link rewriting, key removal) over a
+corpus of realistic posts, and compares ops/sec and peak allocations with the
+stored baseline. Exits with 1 when a case regresses beyond the threshold.
+
+Speed is compared relative to a fixed pure-python calibration loop, so the
+baseline stays meaningful on a different machine.
+
+    python benchmarks/text_processing.py            # check against baseline
+    python benchmarks/text_processing.py --save     # store new baseline
+"""
+
+import json
+import random
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from aiogram import types
+from common.config import cfg
+
+cfg.data = {}
+cfg.load_settings()
+
+from common.matcher import KeyMatcher
+from telegram.utils import (
+    get_entity_ranges,
+    get_link_preview,
+    get_link_replacements,
+    rewrite_text,
+)
+
+BASELINE = Path(__file__).resolve().parent / "baselines" / "text_processing.json"
+EMOJIS = "🎉📰🔥✅👉🚀😀🇺🇦❤️⚡"
+WORDS = (
+    "news update release today market report city weather match team game "
+    "price new big small first last video photo read more details"
+).split()
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+class PostBuilder:
+    def __init__(self, seed: int) -> None:
+        self.random = random.Random(seed)
+        self.text = ""
+        self.entities = []
+
+    def words(self, count: int, emoji_share: float = 0.0) -> "PostBuilder":
+        for _ in range(count):
+            if self.random.random() < emoji_share:
+                self.text += self.random.choice(EMOJIS) + " "
+            self.text += self.random.choice(WORDS) + " "
+        return self
+
+    def link(self, scheme: bool = True) -> "PostBuilder":
+        link = f"example{self.random.randint(1, 99)}.com/{self.random.choice(WORDS)}"
+        if scheme:
+            link = f"https://{link}"
+        self.entities.append(
+            types.MessageEntity(
+                type="url", offset=utf16_len(self.text), length=utf16_len(link)
+            )
+        )
+        self.text += link + " "
+        return self
+
+    def key(self, key: str) -> "PostBuilder":
+        self.text += key + " "
+        return self
+
+    def build(self) -> tuple[str, list[types.MessageEntity]]:
+        return self.text.rstrip(), self.entities
+
+
+def make_corpus() -> dict[str, dict[str, Any]]:
+    keys = [f"#key{number}" for number in range(20)]
+    matcher = KeyMatcher(keys)
+    corpus = {}
+
+    corpus["plain"] = PostBuilder(1).words(30).build()
+
+    post = PostBuilder(2)
+    for _ in range(5):
+        post.words(12, emoji_share=0.5).link(scheme=False)
+    corpus["emoji"] = post.build()
+
+    post = PostBuilder(3)
+    for number in range(30):
+        post.words(2).link(scheme=number % 3 != 0)
+    corpus["urls"] = post.build()
+
+    # caption limit is 1024
+    post = PostBuilder(4)
+    while len(post.text) < 900:
+        post.words(15, emoji_share=0.1).link()
+    corpus["long_caption"] = post.key("#key1").key("#key7").build()
+
+    post = PostBuilder(5)
+    for number in range(15):
+        post.words(3).key(keys[number])
+    corpus["keys"] = post.build()
+
+    # message limit is 4096
+    post = PostBuilder(6)
+    while len(post.text) < 3900:
+        post.words(20, emoji_share=0.2).link(scheme=post.random.random() < 0.7)
+        post.key(post.random.choice(keys))
+    corpus["long_text"] = post.build()
+
+    return {
+        name: {"text": text, "entities": entities, "matcher": matcher}
+        for name, (text, entities) in corpus.items()
+    }
+
+
+def process(text: str, entities: list[types.MessageEntity], matcher: KeyMatcher):
+    key_occurrences = matcher.find(text)
+    link_ranges = get_entity_ranges(text, entities)
+    # probes are cached in production, schemes are known here
+    link_schemes = {start: "https" for start, _ in link_ranges}
+    link_preview = get_link_preview(text, link_ranges, None, False)
+    links, _ = get_link_replacements(text, link_ranges, link_schemes, link_preview)
+    return rewrite_text(text, links, matcher, key_occurrences)
+
+
+def calibration() -> None:
+    parts = []
+    for number in range(200):
+        parts.append(str(number * 7 % 13))
+    "".join(parts).find("12")
+
+
+def calibrate_loops(op: Callable[[], Any], seconds: float) -> int:
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            op()
+        if time.perf_counter() - start > seconds:
+            return loops
+        loops *= 2
+
+
+def measure_speed(
+    op: Callable[[], Any], duration: float, repeat: int
+) -> tuple[float, float]:
+    """Best ops/sec of op and of calibration loop, measured in alternating
+    rounds, so both see the same machine state. Minimum time of a round is
+    the least noisy estimate."""
+    round_seconds = duration / repeat / 2
+    loops = calibrate_loops(op, round_seconds)
+    calibration_loops = calibrate_loops(calibration, round_seconds)
+    best = float("inf")
+    best_calibration = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calibration_loops):
+            calibration()
+        best_calibration = min(best_calibration, time.perf_counter() - start)
+        start = time.perf_counter()
+        for _ in range(loops):
+            op()
+        best = min(best, time.perf_counter() - start)
+    return loops / best, calibration_loops / best_calibration
+
+
+def measure_allocations(op: Callable[[], Any]) -> int:
+    """Peak bytes allocated by one op."""
+    op()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        op()
+        _, peak = tracemalloc.get_traced_memory()
+        return peak - current
+    finally:
+        tracemalloc.stop()
+
+
+def run(duration: float, repeat: int) -> dict[str, Any]:
+    results = {"cases": {}}
+    for name, post in make_corpus().items():
+
+        def op() -> Any:
+            return process(post["text"], post["entities"], post["matcher"])
+
+        ops, calibration_ops = measure_speed(op, duration, repeat)
+        results["cases"][name] = {
+            "ops": ops,
+            "calibration_ops": calibration_ops,
+            "relative": ops / calibration_ops,
+            "peak_bytes": measure_allocations(op),
+        }
+    return results
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any], threshold: float):
+    failed = []
+    for name, case in results["cases"].items():
+        base = baseline["cases"].get(name)
+        if base is None:
+            print(f"{name:14} {case['ops']:10.0f} ops/s {case['peak_bytes']:8} B  new")
+            continue
+        speed = case["relative"] / base["relative"] - 1
+        memory = case["peak_bytes"] / max(base["peak_bytes"], 1) - 1
+        status = "ok"
+        if speed < -threshold or memory > threshold:
+            status = "REGRESSION"
+            failed.append(name)
+        print(
+            f"{name:14} {case['ops']:10.0f} ops/s ({speed:+.1%})"
+            f" {case['peak_bytes']:8} B ({memory:+.1%})  {status}"
+        )
+    return failed
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Text processing microbenchmarks")
+    parser.add_argument("--save", action="store_true", help="store as baseline")
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument(
+        "--threshold", type=float, default=0.3, help="allowed regression share"
+    )
+    parser.add_argument("--duration", type=float, default=1.0, help="per case, s")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    results = run(args.duration, args.repeat)
+    baseline_path = Path(args.baseline)
+    if args.save or not baseline_path.exists():
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        for name, case in results["cases"].items():
+            print(f"{name:14} {case['ops']:10.0f} ops/s {case['peak_bytes']:8} B")
+        print(f"Baseline saved to {baseline_path}")
+        return
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    failed = compare(results, baseline, args.threshold)
+    if failed:
+        print(f"Regressed beyond {args.threshold:.0%}: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from common.config import cfg
+
+cfg.data = {}
+cfg.load_settings()
+cfg.DB_CONNECTION_STRING = "sqlite+aiosqlite:///" + os.path.join(
+    tempfile.mkdtemp(prefix="wftb-tests-"), "tests.db"
+)
+
+
+class CollectingExporter:
+    def __init__(self) -> None:
+        self.spans = []
+
+    def export(self, span) -> None:
+        self.spans.append(span)
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    from common.tracing import tracer
+
+    exporter = CollectingExporter()
+    monkeypatch.setattr(tracer, "exporter", exporter)
+    return exporter
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from crud import media_groups as crud_media_groups
+from db.models import Base
+from db.utils import _engine, dispose_engines
+
+
+@pytest.fixture(scope="module", autouse=True)
+def database():
+    async def create() -> None:
+        async with _engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await dispose_engines()
+
+    asyncio.run(create())
+
+
+def run(coroutine):
+    async def run_and_dispose():
+        try:
+            return await coroutine
+        finally:
+            await dispose_engines()
+
+    return asyncio.run(run_and_dispose())
+
+
+def test_claim_returns_parts_in_message_order():
+    for message_id in (3, 1, 2):
+        assert run(
+            crud_media_groups.add_media_group_part(
+                "ordered", message_id, {"message_id": message_id}
+            )
+        )
+    parts = run(crud_media_groups.claim_media_group("ordered", 0, 0))
+    assert [part["message_id"] for part in parts] == [1, 2, 3]
+
+
+def test_group_waits_for_quiet_window():
+    run(crud_media_groups.add_media_group_part("quiet", 1, {}))
+    wait = run(crud_media_groups.claim_media_group("quiet", 60, 600))
+    assert isinstance(wait, float) and 0 < wait <= 60
+
+
+def test_late_part_is_rejected_after_claim():
+    run(crud_media_groups.add_media_group_part("late", 1, {"message_id": 1}))
+    assert run(crud_media_groups.claim_media_group("late", 0, 0)) == [{"message_id": 1}]
+
+    assert not run(crud_media_groups.add_media_group_part("late", 2, {}))
+    # no partial group is formed again
+    assert run(crud_media_groups.claim_media_group("late", 0, 0)) is None
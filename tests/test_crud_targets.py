@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+from crud import chats as crud_chats
+from crud import targets as crud_targets
+from db.models import Base
+from db.utils import _engine, dispose_engines
+
+
+@pytest.fixture(scope="module", autouse=True)
+def database():
+    async def create() -> None:
+        async with _engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await crud_chats.add_chat(-6001, 6000)
+        await crud_chats.add_chat(-6002, 6000)
+        await dispose_engines()
+
+    asyncio.run(create())
+
+
+def run(coroutine):
+    async def run_and_dispose():
+        try:
+            return await coroutine
+        finally:
+            await dispose_engines()
+
+    return asyncio.run(run_and_dispose())
+
+
+def add_target(webhook: str, chat_id: int) -> bool:
+    return run(crud_targets.add_target(webhook, "target", chat_id, None, None, False))
+
+
+def test_add_target_with_taken_webhook_returns_false():
+    webhook = "https://example.com/6001"
+    assert add_target(webhook, -6001) is True
+    # same chat and another chat, no IntegrityError
+    assert add_target(webhook, -6001) is False
+    assert add_target(webhook, -6002) is False
+    assert [t["webhook"] for t in run(crud_targets.get_targets(-6002))] == []
+
+
+def test_update_target_returns_whether_it_existed():
+    add_target("https://example.com/6002", -6001)
+    (target,) = [
+        target
+        for target in run(crud_targets.get_targets(-6001))
+        if target["webhook"] == "https://example.com/6002"
+    ]
+    assert run(crud_targets.update_target(target["id"], {"name": "edited"})) is True
+    assert run(crud_targets.update_target(10**9, {"name": "edited"})) is False
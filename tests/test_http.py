@@ -0,0 +1,85 @@
+import asyncio
+import socket
+import ssl
+
+import httpx
+import pytest
+from aiohttp import web
+from common.config import cfg
+from common.http import HTTPPool, PoolTransport, TracingTransport
+from common.resolver import ResolvingNetworkBackend
+
+
+@pytest.fixture
+def http_settings(monkeypatch):
+    monkeypatch.setattr(cfg, "HTTP_MAX_CONNECTIONS", 7)
+    monkeypatch.setattr(cfg, "HTTP_MAX_KEEPALIVE_CONNECTIONS", 3)
+    monkeypatch.setattr(cfg, "HTTP_KEEPALIVE_EXPIRY", 12.5)
+    monkeypatch.setattr(cfg, "HTTP_RETRIES", 2)
+    monkeypatch.setattr(cfg, "HTTP_HTTP2", False)
+    monkeypatch.setattr(cfg, "DNS_CACHE", True)
+
+
+def pool_transport(client: httpx.AsyncClient) -> PoolTransport:
+    transport = client._transport
+    if isinstance(transport, TracingTransport):
+        transport = transport._transport
+    return transport
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_pool_keeps_settings(http_settings):
+    async def run():
+        http_pool = HTTPPool()
+        await http_pool.start()
+        try:
+            transport = pool_transport(http_pool.client)
+            assert isinstance(transport, PoolTransport)
+            pool = transport.pool
+            assert pool._max_connections == 7
+            assert pool._max_keepalive_connections == 3
+            assert pool._keepalive_expiry == 12.5
+            assert pool._retries == 2
+            assert pool._http2 is False
+            assert isinstance(pool._ssl_context, ssl.SSLContext)
+            assert pool._ssl_context.verify_mode == ssl.CERT_REQUIRED
+            assert pool._ssl_context.check_hostname
+            assert isinstance(pool._network_backend, ResolvingNetworkBackend)
+        finally:
+            await http_pool.close()
+
+    asyncio.run(run())
+
+
+def test_pool_round_trip(http_settings):
+    async def handler(request: web.Request) -> web.Response:
+        return web.Response(text=f"got {await request.text()}")
+
+    async def run():
+        app = web.Application()
+        app.router.add_post("/hook", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        port = free_port()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        http_pool = HTTPPool()
+        await http_pool.start()
+        try:
+            response = await http_pool.client.post(
+                f"http://127.0.0.1:{port}/hook", content=b"post"
+            )
+            assert response.status_code == 200
+            assert response.text == "got post"
+
+            with pytest.raises(httpx.ConnectError):
+                await http_pool.client.get(f"http://127.0.0.1:{free_port()}/")
+        finally:
+            await http_pool.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+from common.matcher import KeyMatcher
+
+
+def old_match(keys: set[str], text: str) -> set[str]:
+    return {key for key in keys if key in text}
+
+
+def old_strip(keys: set[str], text: str) -> str:
+    # longest first, so a key doesn't leave a fragment of a longer one behind
+    for key in sorted(keys, key=len, reverse=True):
+        text = text.replace(key, "")
+    return text
+
+
+CASES = [
+    # overlapping keys, one is a prefix of the other
+    ({"#new", "#news"}, "#news and #new #newsletter"),
+    # a key that is a suffix of another
+    ({"#mynews", "news"}, "#mynews, news and #mynewsnews"),
+    # keys inside of words
+    ({"#a", "tag"}, "x#ab hashtags #a"),
+    ({"#news"}, "no keys here"),
+    ({"#news"}, ""),
+    ({"#news", "#sport"}, "#sport#news#sport"),
+    ({"😀", "#ключ"}, "😀 #ключи 😀"),
+]
+
+
+@pytest.mark.parametrize("keys, text", CASES)
+def test_parity_with_in_and_replace(keys, text):
+    matcher = KeyMatcher(keys)
+    assert matcher.match(text) == old_match(keys, text)
+    assert matcher.strip(text) == old_strip(keys, text)
+    assert matcher.strip(text, matcher.find(text)) == old_strip(keys, text)
+
+
+def test_find_reports_every_occurrence():
+    matcher = KeyMatcher({"#new", "#news", "news"})
+    assert sorted(matcher.find("#news")) == [
+        (0, 4, "#new"),
+        (0, 5, "#news"),
+        (1, 5, "news"),
+    ]
+    # the longest key at the leftmost position is removed
+    assert matcher.select(matcher.find("#news")) == [(0, 5)]
+
+
+def test_empty_key_set():
+    for matcher in (KeyMatcher([]), KeyMatcher({""}), KeyMatcher({None})):
+        assert not matcher.keys
+        assert matcher.find("#news") == []
+        assert matcher.match("#news") == set()
+        assert matcher.strip("#news") == "#news"
+
+
+def test_match_parity_on_random_texts():
+    generator = random.Random(12)
+    alphabet = "ab#c "
+    for _ in range(500):
+        keys = {
+            "".join(generator.choices(alphabet, k=generator.randint(1, 4)))
+            for _ in range(generator.randint(0, 5))
+        }
+        text = "".join(generator.choices(alphabet, k=generator.randint(0, 30)))
+        assert KeyMatcher(keys).match(text) == old_match(keys, text), (keys, text)
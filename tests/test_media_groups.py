@@ -0,0 +1,123 @@
+import asyncio
+import logging
+
+import pytest
+from aiogram import types
+from common.tracing import tracer
+from telegram.media_groups import MediaGroupAggregator, MemoryMediaGroupStore
+
+
+def make_part(message_id: int) -> types.Message:
+    return types.Message.model_validate(
+        {
+            "message_id": message_id,
+            "date": 1700000000,
+            "chat": {"id": -1001, "type": "channel"},
+            "media_group_id": "album",
+        }
+    )
+
+
+def make_data() -> dict:
+    return {
+        "bot": None,
+        "message_text_original": "",
+        "message_text_edited": "",
+        "matched_keys": set(),
+    }
+
+
+async def noop_handler(event, data) -> None:
+    pass
+
+
+class FailingStore:
+    async def add(self, media_group_id, part) -> bool:
+        return True
+
+    async def claim(self, media_group_id, quiet_window, max_wait, bot):
+        raise RuntimeError("store is down")
+
+
+class ScriptedStore:
+    def __init__(self, *claims) -> None:
+        self.claims = list(claims)
+
+    async def add(self, media_group_id, part) -> bool:
+        return True
+
+    async def claim(self, media_group_id, quiet_window, max_wait, bot):
+        claim = self.claims.pop(0)
+        if isinstance(claim, Exception):
+            raise claim
+        return claim
+
+
+@pytest.mark.parametrize(
+    "claims, outcome",
+    [
+        ([0.01, [dict(make_data(), event=None)]], "claimed"),
+        ([0.01, None], "taken"),
+        ([0.01, RuntimeError("store is down")], "error"),
+    ],
+)
+def test_wait_span_ends_once(exporter, claims, outcome):
+    store = ScriptedStore(*claims)
+
+    async def handler(event, data) -> None:
+        pass
+
+    async def run() -> None:
+        aggregator = MediaGroupAggregator(store, 0.01, 10)
+        with tracer.continue_trace("update", {"trace_id": "t", "span_id": "s"}):
+            await aggregator.add(make_part(1), make_data(), handler)
+        # first claim asks to wait, the second one ends the wait
+        for _ in range(100):
+            if not store.claims:
+                break
+            await asyncio.sleep(0.01)
+        await aggregator.close()
+
+    asyncio.run(run())
+
+    spans = [span for span in exporter.spans if span["name"] == "media_group_wait"]
+    assert len(spans) == 1
+    assert spans[0]["attributes"]["claim"] == outcome
+    assert ("error" in spans[0]) == (outcome == "error")
+
+
+def test_failed_flush_is_logged(caplog):
+    async def run() -> None:
+        aggregator = MediaGroupAggregator(FailingStore(), 10, 10)
+        await aggregator.add(make_part(1), make_data(), noop_handler)
+        await aggregator.close()
+
+    with caplog.at_level(logging.ERROR, logger="wftb.telegram.media_groups"):
+        asyncio.run(run())
+
+    records = [r for r in caplog.records if r.name == "wftb.telegram.media_groups"]
+    assert len(records) == 1
+    assert "Media group wasn't handled" in records[0].getMessage()
+    assert "store is down" in records[0].getMessage()
+    assert records[0].exc_info[0] is RuntimeError
+
+
+def test_late_part_is_dropped(caplog):
+    handled = []
+
+    async def handler(event, data) -> None:
+        handled.append([message.message_id for message in data["messages_group"]])
+
+    async def run() -> None:
+        aggregator = MediaGroupAggregator(MemoryMediaGroupStore(), 0.01, 10)
+        await aggregator.add(make_part(1), make_data(), handler)
+        await aggregator.add(make_part(2), make_data(), handler)
+        await asyncio.sleep(0.1)
+        await aggregator.add(make_part(3), make_data(), handler)
+        await aggregator.close()
+
+    with caplog.at_level(logging.WARNING, logger="wftb.telegram.media_groups"):
+        asyncio.run(run())
+
+    assert handled == [[1, 2]]
+    assert "came after the group was forwarded" in caplog.text
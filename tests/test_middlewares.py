@@ -0,0 +1,79 @@
+import asyncio
+
+from aiogram import types
+from crud.routing import build_routing
+from telegram import middlewares
+from telegram.middlewares import ForwardChannelMiddleware
+
+
+def make_post(text: str, entities: list[dict], **fields) -> types.Message:
+    return types.Message.model_validate(
+        {
+            "message_id": 1,
+            "date": 1700000000,
+            "chat": {"id": -1001, "type": "channel"},
+            "text": text,
+            "entities": entities,
+            **fields,
+        }
+    )
+
+
+def forward(monkeypatch, post: types.Message, keys: list[str | None]) -> dict:
+    targets = [
+        {"id": number, "key": key, "always_link_preview": False}
+        for number, key in enumerate(keys)
+    ]
+
+    async def get_routing(chat_id: int) -> dict:
+        return build_routing(targets)
+
+    monkeypatch.setattr(middlewares, "get_routing", get_routing)
+    handled = {}
+
+    async def handler(event, data) -> None:
+        handled.update(data)
+
+    asyncio.run(ForwardChannelMiddleware()(handler, post, {}))
+    return handled
+
+
+def test_post_without_keys_and_links_skips_text_processing(monkeypatch):
+    def get_entity_ranges(*args):
+        raise AssertionError("text was processed")
+
+    monkeypatch.setattr(middlewares, "get_entity_ranges", get_entity_ranges)
+    post = make_post("😀 plain post", [{"type": "bold", "offset": 3, "length": 5}])
+    data = forward(monkeypatch, post, [None])
+    assert data["message_text_original"] == "😀 plain post"
+    assert data["message_text_edited"] == "😀 plain post"
+    assert data["matched_keys"] == set()
+    assert data["messages_group"] == [post]
+
+
+def test_fast_path_matches_full_processing(monkeypatch):
+    post = make_post("😀 plain post", [{"type": "bold", "offset": 3, "length": 5}])
+    fast = forward(monkeypatch, post, [None])
+    # an unmatched key takes the full path
+    full = forward(monkeypatch, post, [None, "#unused"])
+    assert fast == full
+
+
+def test_post_with_link_is_processed(monkeypatch):
+    processed = []
+    get_entity_ranges = middlewares.get_entity_ranges
+
+    def counting_get_entity_ranges(*args):
+        processed.append(True)
+        return get_entity_ranges(*args)
+
+    monkeypatch.setattr(middlewares, "get_entity_ranges", counting_get_entity_ranges)
+    post = make_post(
+        "read https://example.com",
+        [{"type": "url", "offset": 5, "length": 19}],
+        # no preview, so the post isn't edited to force one
+        link_preview_options={"is_disabled": True},
+    )
+    data = forward(monkeypatch, post, [None])
+    assert processed
+    assert data["message_text_edited"] == "read <https://example.com>"
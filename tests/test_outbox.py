@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from common.config import cfg
+from crud import chats as crud_chats
+from crud import deliveries as crud_deliveries
+from telegram import outbox as outbox_module
+from telegram.outbox import Outbox
+
+OWNER_ID = 1000
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.messages = []
+
+    async def send_message(self, chat_id: int, text: str) -> None:
+        self.messages.append((chat_id, text))
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    async def get_owner(chat_id: int) -> int:
+        return OWNER_ID
+
+    async def noop(*args) -> None:
+        pass
+
+    monkeypatch.setattr(crud_chats, "get_owner", get_owner)
+    monkeypatch.setattr(crud_deliveries, "reschedule_delivery", noop)
+    monkeypatch.setattr(crud_deliveries, "remove_deliveries", noop)
+    monkeypatch.setattr(cfg, "OUTBOX_MAX_ATTEMPTS", 3)
+    outbox = Outbox()
+    outbox._bot = FakeBot()
+    return outbox
+
+
+def fail(outbox: Outbox, status_code: int | None, attempts: int) -> None:
+    delivery = {"id": 1, "chat_id": -1001, "attempts": attempts}
+    asyncio.run(outbox._failed(delivery, status_code))
+
+
+def test_owner_is_notified_on_first_failure_and_give_up(outbox):
+    for attempts in (1, 2, 3):
+        fail(outbox, 503, attempts)
+    assert outbox._bot.messages == [
+        (OWNER_ID, "Channel message wasn't forwarded - 503, retrying"),
+        (
+            OWNER_ID,
+            "Channel message wasn't forwarded - 503, gave up after 3 attempts",
+        ),
+    ]
+
+
+def test_owner_is_notified_once_when_not_retried(outbox):
+    fail(outbox, 404, 1)
+    assert outbox._bot.messages == [
+        (OWNER_ID, "Channel message wasn't forwarded - 404"),
+    ]
+
+
+def file_delivery(group_id: str, file_ids: list[str], attempts: int) -> dict:
+    return {
+        "attempts": attempts,
+        "payload": {
+            "media_group_id": group_id,
+            "files": [{"file_id": file_id} for file_id in file_ids],
+        },
+    }
+
+
+def test_download_is_recorded_per_group_once(monkeypatch, outbox):
+    recorded = []
+
+    async def download_to_spool(bot, file_id):
+        await asyncio.sleep(0.05)
+        return file_id
+
+    def record_download(group_id, files, seconds) -> None:
+        recorded.append((group_id, files, seconds))
+
+    monkeypatch.setattr(outbox_module, "download_to_spool", download_to_spool)
+    monkeypatch.setattr(outbox_module, "record_download", record_download)
+
+    async def run() -> dict:
+        # one download at a time, the second group waits behind the first one
+        outbox._download_semaphore = asyncio.Semaphore(1)
+        return await outbox._download_files(
+            [
+                file_delivery("first", ["a1", "a2"], 1),
+                file_delivery("second", ["b1"], 1),
+                file_delivery("retried", ["c1"], 2),
+            ]
+        )
+
+    downloaded = asyncio.run(run())
+
+    assert downloaded == {"a1": "a1", "a2": "a2", "b1": "b1", "c1": "c1"}
+    assert [(group_id, files) for group_id, files, _ in recorded] == [
+        ("first", 2),
+        ("second", 1),
+    ]
+    seconds = {group_id: seconds for group_id, _, seconds in recorded}
+    assert seconds["first"] >= 0.1
+    # its own download only, not the time queued behind "first"
+    assert 0.05 <= seconds["second"] < 0.1
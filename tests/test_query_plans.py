@@ -0,0 +1,227 @@
+"""Query plans of CRUD statements on SQLite.
+
+Every crud function runs against a database built from the models, each
+statement it runs is a case. Reads mustn't scan a whole table that isn't in
+ALLOWED_SCANS and upserts must have a unique index on their conflict target,
+so a dropped index or a changed filter fails here.
+
+    python -m pytest tests/test_query_plans.py -v
+"""
+
+import asyncio
+import re
+import sqlite3
+from functools import cache
+from typing import Any, Awaitable, Callable
+
+import pytest
+from crud import chats as crud_chats
+from crud import deliveries as crud_deliveries
+from crud import media_groups as crud_media_groups
+from crud import targets as crud_targets
+from crud.routing import routing_table
+from db.models import Base, Chats, Targets
+from db.utils import _engine, _read_engine, dispose_engines
+from sqlalchemy import event, insert
+
+# (crud function, table) -> why reading the whole table is fine
+ALLOWED_SCANS = {
+    ("get_webhooks", "targets"): "every webhook is returned",
+    ("load_allowlist", "chats"): "every chat is returned",
+    ("remove_stale_media_groups", "media_groups"): "holds only groups in flight",
+    ("refresh_routing", "chats"): "snapshot of every chat",
+    ("refresh_routing", "targets"): "snapshot of every target",
+}
+PLAN_SCAN = re.compile(r"^SCAN (?:TABLE )?(?:\w+\.)?(\w+)")
+UPSERT = re.compile(
+    r"^INSERT INTO (?:\w+\.)?(\w+) .* ON CONFLICT(?: \(([^)]*)\))?", re.DOTALL
+)
+OWNER_ID = 1000
+CHAT_ID = -1001
+
+
+async def create_database() -> None:
+    async with _engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(
+            insert(Chats),
+            [
+                {"id": -1000 - number, "owner_id": OWNER_ID + number % 10}
+                for number in range(100)
+            ],
+        )
+        await conn.execute(
+            insert(Targets),
+            [
+                {
+                    "webhook": f"https://example.com/hook/{number}",
+                    "name": f"target{number}",
+                    "chat_id": -1000 - number % 100,
+                    "key": f"#key{number % 5}" if number % 2 else None,
+                    "prefix": None,
+                    "always_link_preview": False,
+                }
+                for number in range(300)
+            ],
+        )
+
+
+def crud_calls() -> list[tuple[str, Callable[[], Awaitable[Any]]]]:
+    payload = {"chat_id": CHAT_ID, "text": "post"}
+    return [
+        ("check_webhook", lambda: crud_targets.check_webhook("https://new.com")),
+        (
+            "add_target",
+            lambda: crud_targets.add_target(
+                "https://new.com", "new", CHAT_ID, "#new", None, False
+            ),
+        ),
+        ("update_target", lambda: crud_targets.update_target(1, {"name": "edited"})),
+        ("get_targets", lambda: crud_targets.get_targets(CHAT_ID)),
+        ("get_webhooks", crud_targets.get_webhooks),
+        ("remove_target", lambda: crud_targets.remove_target(1, CHAT_ID)),
+        ("get_owner", lambda: crud_chats.get_owner(-1002)),
+        ("get_owned_chats", lambda: crud_chats.get_owned_chats(OWNER_ID)),
+        ("add_chat", lambda: crud_chats.add_chat(-2000, OWNER_ID)),
+        ("load_allowlist", crud_chats.load_allowlist),
+        ("refresh_routing", routing_table.refresh),
+        ("remove_chats", lambda: crud_chats.remove_chats([-1003, -1004])),
+        (
+            "enqueue_deliveries",
+            lambda: crud_deliveries.enqueue_deliveries(
+                [
+                    {
+                        "chat_id": CHAT_ID,
+                        "target_id": 2,
+                        "webhook": "https://example.com/hook/2",
+                        "payload": payload,
+                    }
+                ]
+            ),
+        ),
+        ("claim_deliveries", lambda: crud_deliveries.claim_deliveries(10, 30)),
+        ("reschedule_delivery", lambda: crud_deliveries.reschedule_delivery(1, 5)),
+        ("remove_deliveries", lambda: crud_deliveries.remove_deliveries([1])),
+        (
+            "add_media_group_part",
+            lambda: crud_media_groups.add_media_group_part("group", 1, payload),
+        ),
+        (
+            "claim_media_group",
+            lambda: crud_media_groups.claim_media_group("group", 0, 0),
+        ),
+        (
+            "remove_stale_media_groups",
+            lambda: crud_media_groups.remove_stale_media_groups(60),
+        ),
+    ]
+
+
+async def capture() -> list[tuple[str, str, Any]]:
+    """(crud function, statement, parameters) of every statement run."""
+    statements = []
+    current = None
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if many:
+            parameters = parameters[0]
+        statements.append((current, statement, parameters))
+
+    await create_database()
+    engines = {_engine.sync_engine, _read_engine.sync_engine}
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        for name, call in crud_calls():
+            current = name
+            await call()
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        await dispose_engines()
+    return statements
+
+
+@cache
+def captured() -> tuple[tuple[str, str, Any], ...]:
+    # once, a second run would be served by the chat directory cache
+    return tuple(asyncio.run(capture()))
+
+
+def pytest_generate_tests(metafunc) -> None:
+    if "statement" not in metafunc.fixturenames:
+        return
+    statements = captured()
+    if metafunc.function is test_upsert_has_unique_index:
+        statements = [
+            statement for statement in statements if UPSERT.match(statement[1])
+        ]
+    seen = {}
+    ids = []
+    for name, _, _ in statements:
+        seen[name] = seen.get(name, 0) + 1
+        ids.append(f"{name}-{seen[name]}")
+    metafunc.parametrize("name, statement, parameters", statements, ids=ids)
+
+
+@pytest.fixture(scope="module")
+def conn():
+    conn = sqlite3.connect(_engine.url.database)
+    yield conn
+    conn.close()
+
+
+def full_scans(plan: list[str]) -> list[str]:
+    """Tables read without an index, a covering index scan isn't one."""
+    tables = []
+    for detail in plan:
+        match = PLAN_SCAN.match(detail)
+        # SELECT EXISTS (...) reads one constant row
+        if match and "INDEX" not in detail and detail != "SCAN CONSTANT ROW":
+            tables.append(match.group(1))
+    return tables
+
+
+def unique_keys(conn: sqlite3.Connection, table: str) -> set[tuple[str, ...]]:
+    """Column sets a conflict is found by without reading the table."""
+    keys = set()
+    for _, index, unique, _, _ in conn.execute(f"PRAGMA index_list({table})"):
+        if unique:
+            columns = conn.execute(f"PRAGMA index_info({index})")
+            keys.add(tuple(sorted(column[2] for column in columns)))
+    # INTEGER PRIMARY KEY is the rowid, it has no index of its own
+    primary = [
+        (column[1], column[2])
+        for column in conn.execute(f"PRAGMA table_info({table})")
+        if column[5]
+    ]
+    if len(primary) == 1 and primary[0][1].upper() == "INTEGER":
+        keys.add((primary[0][0],))
+    return keys
+
+
+def test_every_call_is_captured() -> None:
+    called = {name for name, _, _ in captured()}
+    assert [name for name, _ in crud_calls() if name not in called] == []
+
+
+def test_no_full_scans(conn, name, statement, parameters) -> None:
+    # prepared, so an upsert without a unique constraint on its target fails here
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+    plan = [row[3] for row in rows]
+    unexpected = [
+        table for table in full_scans(plan) if (name, table) not in ALLOWED_SCANS
+    ]
+    assert unexpected == [], "\n".join(plan)
+
+
+def test_upsert_has_unique_index(conn, name, statement, parameters) -> None:
+    table, target = UPSERT.match(statement).groups()
+    keys = unique_keys(conn, table)
+    if target is None:
+        # DO NOTHING on any conflict, there must be something to conflict on
+        assert keys, f"{table} has no unique index"
+    else:
+        columns = tuple(sorted(column.strip(' "') for column in target.split(",")))
+        assert columns in keys, f"no unique index on {table} {columns}"
@@ -0,0 +1,56 @@
+import threading
+
+from common.config import cfg
+from telegram.recorder import UpdateRecorder, redact_text
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def utf16_slice(text: str, offset: int, length: int) -> str:
+    units = text.encode("utf-16-le")
+    return units[offset * 2 : (offset + length) * 2].decode("utf-16-le")
+
+
+def test_redaction_keeps_lengths_and_entities():
+    text = "😀 News 🎉 at example.com/a 👍🏽 #news and $USD 🇺🇦 end"
+    entities = []
+    for kind, part in (
+        ("url", "example.com/a"),
+        ("hashtag", "#news"),
+        ("cashtag", "$USD"),
+        ("bold", "and"),
+    ):
+        offset = utf16_len(text[: text.index(part)])
+        entities.append({"type": kind, "offset": offset, "length": utf16_len(part)})
+
+    redacted = redact_text(text, entities)
+
+    assert utf16_len(redacted) == utf16_len(text)
+    assert len(redacted) == len(text)
+    for entity in entities:
+        original = utf16_slice(text, entity["offset"], entity["length"])
+        kept = utf16_slice(redacted, entity["offset"], entity["length"])
+        if entity["type"] == "bold":
+            assert kept == "xxx"
+        else:
+            assert kept == original
+    # emojis and spaces stay, so the offsets after them stay too
+    assert redacted.startswith("😀 xxxx 🎉 xx ")
+    assert "👍🏽" in redacted and "🇺🇦" in redacted
+    assert "News" not in redacted
+
+
+def test_full_queue_drops_updates(monkeypatch):
+    monkeypatch.setattr(cfg, "RECORDER_QUEUE_SIZE", 2)
+    recorder = UpdateRecorder()
+    # a writer that doesn't write, the disk stalled
+    recorder._thread = threading.Thread(target=lambda: None)
+
+    for update_id in range(5):
+        recorder.record({"update_id": update_id})
+
+    assert recorder.stats() == {"queued": 2, "recorded": 0, "dropped": 3}
+    # the writer is gone, stop doesn't wait for it
+    recorder.stop()
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+import httpcore
+import pytest
+from common.resolver import ResolvingNetworkBackend
+
+
+class FakeResolver:
+    def __init__(self, addresses: list[str], delay: float = 0.0) -> None:
+        self.addresses = addresses
+        self.delay = delay
+
+    async def resolve(self, host: str) -> list[str]:
+        await asyncio.sleep(self.delay)
+        return self.addresses
+
+
+class UnreachableBackend:
+    """Every address hangs until its connect timeout."""
+
+    def __init__(self) -> None:
+        self.timeouts = []
+
+    async def connect_tcp(self, address, port, timeout=None, **kwargs):
+        self.timeouts.append(timeout)
+        await asyncio.sleep(timeout)
+        raise httpcore.ConnectTimeout(f"{address} timed out")
+
+
+def connect(resolver: FakeResolver, timeout: float) -> tuple[float, list[float]]:
+    backend = ResolvingNetworkBackend(resolver)
+    backend._backend = UnreachableBackend()
+
+    async def run() -> None:
+        await backend.connect_tcp("example.com", 443, timeout=timeout)
+
+    started = time.monotonic()
+    with pytest.raises(httpcore.ConnectTimeout):
+        asyncio.run(run())
+    return time.monotonic() - started, backend._backend.timeouts
+
+
+def test_addresses_share_connect_timeout():
+    seconds, timeouts = connect(FakeResolver(["10.0.0.1", "10.0.0.2", "10.0.0.3"]), 0.2)
+    assert seconds < 0.35
+    assert timeouts[0] <= 0.2
+    assert sum(timeouts) < 0.35
+
+
+def test_resolving_is_within_connect_timeout():
+    seconds, timeouts = connect(FakeResolver(["10.0.0.1"], delay=5), 0.1)
+    assert seconds < 0.5
+    assert timeouts == []
+
+
+def test_slow_resolving_leaves_the_rest_for_connecting():
+    seconds, timeouts = connect(FakeResolver(["10.0.0.1"], delay=0.1), 0.2)
+    assert seconds < 0.35
+    assert timeouts[0] < 0.15
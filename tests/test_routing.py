@@ -0,0 +1,227 @@
+import asyncio
+import logging
+
+import pytest
+from common.config import cfg
+from crud import chats as crud_chats
+from crud import targets as crud_targets
+from crud.routing import EMPTY_ROUTING, RoutingSnapshot, bump_version, routing_table
+from db.models import Base, RoutingVersion, Targets
+from db.utils import _engine, _read_engine, async_session, dispose_engines
+from sqlalchemy import event, insert, select
+
+
+@pytest.fixture(scope="module", autouse=True)
+def database():
+    async def create() -> None:
+        async with _engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await dispose_engines()
+
+    asyncio.run(create())
+
+
+@pytest.fixture(autouse=True)
+def snapshot(monkeypatch):
+    monkeypatch.setattr(cfg, "ROUTING_SNAPSHOT", True)
+    # no LISTEN on sqlite, the poll only has to not get in the way
+    monkeypatch.setattr(cfg, "ROUTING_POLL_INTERVAL", 60)
+
+
+def run(coroutine):
+    """In a started routing table, stopped in the same loop."""
+
+    async def run_in_table():
+        await routing_table.start()
+        try:
+            return await coroutine
+        finally:
+            await routing_table.stop()
+            await dispose_engines()
+
+    return asyncio.run(run_in_table())
+
+
+def test_failed_refresh_after_write_is_logged(monkeypatch, caplog):
+    async def refresh() -> None:
+        raise RuntimeError("database is locked")
+
+    async def add() -> bool:
+        monkeypatch.setattr(routing_table, "refresh", refresh)
+        return await crud_targets.add_target(
+            "https://example.com/refresh", "target", -5001, None, None, False
+        )
+
+    with caplog.at_level(logging.ERROR, logger="wftb.crud.routing"):
+        # committed, so the command succeeded
+        assert run(add()) is True
+    assert "database is locked" in caplog.text
+
+
+class StatementCounter:
+    def __init__(self) -> None:
+        self.statements = 0
+
+    def __enter__(self) -> "StatementCounter":
+        for engine in {_engine.sync_engine, _read_engine.sync_engine}:
+            event.listen(engine, "before_cursor_execute", self.count)
+        return self
+
+    def __exit__(self, *args) -> None:
+        for engine in {_engine.sync_engine, _read_engine.sync_engine}:
+            event.remove(engine, "before_cursor_execute", self.count)
+
+    def count(self, *args) -> None:
+        self.statements += 1
+
+
+async def version() -> int:
+    async with async_session() as session:
+        return await session.scalar(
+            select(RoutingVersion.version).where(RoutingVersion.id == 1)
+        )
+
+
+def test_snapshot_indexes_chats_and_targets():
+    snapshot = RoutingSnapshot(
+        7,
+        [(-1, 10), (-2, 10), (-3, 20)],
+        [
+            {"id": 1, "chat_id": -1, "key": "#news"},
+            {"id": 2, "chat_id": -1, "key": None},
+            {"id": 3, "chat_id": -3, "key": "#sport"},
+        ],
+    )
+    assert snapshot.version == 7
+    assert snapshot.targets == 3
+    assert snapshot.owners[-2] == 10
+    assert sorted(snapshot.owned[10]) == [-2, -1]
+    assert [target["id"] for target in snapshot.get_routing(-1)["targets"]] == [1, 2]
+    assert snapshot.get_routing(-1)["keys"] == {"#news"}
+    assert snapshot.get_routing(-1)["matcher"].match("read #news") == {"#news"}
+    # chat without targets
+    assert snapshot.get_routing(-2) is EMPTY_ROUTING
+    assert snapshot.is_allowed_chat(-3) and not snapshot.is_allowed_chat(-4)
+    assert snapshot.is_allowed_owner(20) and not snapshot.is_allowed_owner(30)
+
+
+def test_writes_bump_version():
+    async def writes() -> list[int]:
+        versions = [await version() or 0]
+        await crud_chats.add_chat(-5101, 5100)
+        versions.append(await version())
+        # already added, nothing changes
+        await crud_chats.add_chat(-5101, 5100)
+        versions.append(await version())
+        await crud_targets.add_target(
+            "https://example.com/5101", "target", -5101, "#key", None, False
+        )
+        versions.append(await version())
+        await crud_chats.remove_chats([-5101])
+        versions.append(await version())
+        return versions
+
+    versions = run(writes())
+    start = versions[0]
+    assert versions == [start, start + 1, start + 1, start + 2, start + 3]
+
+
+def test_snapshot_follows_writes():
+    async def writes() -> None:
+        await crud_chats.add_chat(-5201, 5200)
+        await crud_targets.add_target(
+            "https://example.com/5201", "target", -5201, "#key", None, False
+        )
+        snapshot = routing_table.snapshot
+        assert snapshot.version == await version()
+        assert snapshot.owners[-5201] == 5200
+        assert snapshot.get_routing(-5201)["keys"] == {"#key"}
+
+        # unchanged version, nothing is reloaded
+        loads = routing_table.loads
+        await routing_table.refresh()
+        assert routing_table.snapshot is snapshot
+        assert routing_table.loads == loads
+
+        # a change made by another process is loaded with its version
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(
+                    insert(Targets).values(
+                        {
+                            "webhook": "https://example.com/5202",
+                            "name": "other",
+                            "chat_id": -5201,
+                            "key": "#other",
+                            "prefix": None,
+                            "always_link_preview": False,
+                        }
+                    )
+                )
+                await bump_version(session)
+        await routing_table.refresh()
+        assert routing_table.loads == loads + 1
+        assert routing_table.snapshot.get_routing(-5201)["keys"] == {
+            "#key",
+            "#other",
+        }
+
+    run(writes())
+
+
+def test_lookups_are_served_from_snapshot():
+    async def lookups() -> None:
+        generations = (
+            crud_chats.chat_directory.generation,
+            crud_targets.routing_cache.generation,
+        )
+        await crud_chats.add_chat(-5301, 5300)
+        await crud_targets.add_target(
+            "https://example.com/5301", "target", -5301, None, None, False
+        )
+        misses = crud_chats.chat_directory.misses, crud_targets.routing_cache.misses
+        with StatementCounter() as counter:
+            assert await crud_chats.get_owner(-5301) == 5300
+            assert await crud_chats.get_owner(-5399) is None
+            assert await crud_chats.get_owned_chats(5300) == [-5301]
+            assert await crud_chats.get_owned_chats(5399) == []
+            routing = await crud_targets.get_routing(-5301)
+            assert [t["webhook"] for t in routing["targets"]] == [
+                "https://example.com/5301"
+            ]
+        assert counter.statements == 0
+        # the caches aren't touched, by writes either
+        assert (
+            crud_chats.chat_directory.generation,
+            crud_targets.routing_cache.generation,
+        ) == generations
+        assert (
+            crud_chats.chat_directory.misses,
+            crud_targets.routing_cache.misses,
+        ) == misses
+
+    run(lookups())
+
+
+def test_caches_are_the_fallback_without_snapshot(monkeypatch):
+    monkeypatch.setattr(cfg, "ROUTING_SNAPSHOT", False)
+
+    async def lookups() -> None:
+        assert routing_table.snapshot is None
+        await crud_chats.add_chat(-5401, 5400)
+        assert (await crud_targets.get_routing(-5401))["targets"] == []
+        await crud_targets.add_target(
+            "https://example.com/5401", "target", -5401, None, None, False
+        )
+        # the write invalidated the cached routing
+        routing = await crud_targets.get_routing(-5401)
+        assert [t["webhook"] for t in routing["targets"]] == [
+            "https://example.com/5401"
+        ]
+        with StatementCounter() as counter:
+            assert await crud_targets.get_routing(-5401) is routing
+            # add_chat put the owner into the directory
+            assert await crud_chats.get_owner(-5401) == 5400
+        assert counter.statements == 0
+
+    run(lookups())
@@ -0,0 +1,31 @@
+from common.matcher import KeyMatcher
+from telegram.utils import get_link_replacements, rewrite_text
+
+
+def rewrite(text: str, link_ranges: list[tuple[int, int]], schemes: dict):
+    matcher = KeyMatcher(frozenset({"#news"}))
+    links, _ = get_link_replacements(text, link_ranges, schemes, None)
+    return rewrite_text(text, links, matcher, matcher.find(text))
+
+
+def test_keys_are_removed_around_links():
+    text = "#news read example.com #news"
+    edited, fixed = rewrite(text, [(11, 22)], {11: "https"})
+    assert edited == " read example.com "
+    assert fixed == " read <https://example.com> "
+
+
+def test_key_straddling_link_is_removed_whole():
+    # "#news" starts before the link "news.com" and ends inside of it
+    text = "post #news.com end"
+    edited, fixed = rewrite(text, [(6, 14)], {6: None})
+    assert edited == "post .com end"
+    assert fixed == "post .com end"
+
+
+def test_key_straddling_link_matches_replaced_text():
+    # the scheme splits the key, the same as removing keys after replacing links
+    text = "post #news.com end"
+    edited, fixed = rewrite(text, [(6, 14)], {6: "https"})
+    assert edited == "post .com end"
+    assert fixed == "post #<https://news.com> end"
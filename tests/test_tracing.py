@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+import pytest
+from common import tracing
+from common.tracing import tracer
+from telegram import outbox as outbox_module
+from telegram.forwarding import WebhookFanOut
+from telegram.outbox import Outbox
+
+
+async def downstream(trace: dict[str, str] | None) -> None:
+    """What a post goes through after the webhook, out of its context."""
+    with tracer.continue_trace("feed_update", trace):
+        with tracer.span("channel_post_handler"):
+            pass
+
+    async def download_to_spool(bot, file_id):
+        return None
+
+    outbox = Outbox()
+    original = outbox_module.download_to_spool
+    outbox_module.download_to_spool = download_to_spool
+    try:
+        await outbox._download_file("file", trace)
+    finally:
+        outbox_module.download_to_spool = original
+
+    client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200))
+    )
+    target = {"id": 1, "webhook": "https://example.com/hook", "trace": trace}
+    async with client:
+        await WebhookFanOut(1, 1).deliver(client, [(target, {"content": ""}, {})])
+
+
+def run_post() -> None:
+    async def run() -> None:
+        with tracer.trace("webhook_telegram", update_id=1):
+            trace = tracer.context()
+        await downstream(trace)
+
+    asyncio.run(run())
+
+
+def test_unsampled_root_exports_nothing_downstream(monkeypatch, exporter):
+    monkeypatch.setattr(tracer, "sample_rate", 0.5)
+    # the root loses the roll, any later roll would win
+    rolls = iter([0.99])
+    monkeypatch.setattr(tracing.random, "random", lambda: next(rolls, 0.0))
+    run_post()
+    assert exporter.spans == []
+
+
+def test_sampled_root_is_continued(monkeypatch, exporter):
+    monkeypatch.setattr(tracer, "sample_rate", 1.0)
+    run_post()
+    names = [span["name"] for span in exporter.spans]
+    assert sorted(names) == sorted(
+        [
+            "webhook_telegram",
+            "feed_update",
+            "channel_post_handler",
+            "download",
+            "delivery",
+        ]
+    )
+    assert len({span["trace_id"] for span in exporter.spans}) == 1
+    roots = [span for span in exporter.spans if span["parent_id"] is None]
+    assert [root["name"] for root in roots] == ["webhook_telegram"]
+
+
+@pytest.mark.parametrize("sample_rate", [0.0, 1.0])
+def test_continue_trace_without_parent_is_none(monkeypatch, exporter, sample_rate):
+    monkeypatch.setattr(tracer, "sample_rate", sample_rate)
+    with tracer.continue_trace("feed_update", None) as span:
+        assert span is None
+    assert exporter.spans == []
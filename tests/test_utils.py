@@ -0,0 +1,38 @@
+import pytest
+from common.config import cfg
+from common.utils import verify_metrics_token
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+app = FastAPI()
+
+
+@app.get("/metrics", dependencies=[Depends(verify_metrics_token)])
+async def metrics():
+    return "ok"
+
+
+client = TestClient(app)
+
+
+def test_metrics_without_token_is_open(monkeypatch):
+    monkeypatch.setattr(cfg, "METRICS_TOKEN", None)
+    assert client.get("/metrics").status_code == 200
+
+
+@pytest.mark.parametrize(
+    "headers, status_code",
+    [
+        ({}, 401),
+        ({"Authorization": "Bearer wrong"}, 401),
+        ({"Authorization": "secret"}, 401),
+        ({"Authorization": "Bearer secret"}, 200),
+    ],
+)
+def test_metrics_token(monkeypatch, headers, status_code):
+    monkeypatch.setattr(cfg, "METRICS_TOKEN", "secret")
+    assert client.get("/metrics", headers=headers).status_code == status_code
+
+
+def test_metrics_disabled_by_default():
+    assert cfg.METRICS_ENABLED is False